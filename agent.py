@@ -26,9 +26,26 @@
 
 import json
 import logging
+import logging.handlers
 import os
 import asyncio
-from typing import Optional
+import atexit
+import contextvars
+import functools
+import hashlib
+import queue
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+import zlib
+from collections import OrderedDict, deque
+from contextlib import closing
+from typing import Awaitable, Callable, Optional
 from datetime import datetime
 from dotenv import load_dotenv
 
@@ -37,28 +54,153 @@ from livekit.agents import (
     Agent,
     AgentSession,
     JobContext,
+    JobProcess,
     WorkerOptions,
     cli,
     room_io,  # NOVO: Para configurar opções de áudio
 )
+from livekit.agents.utils.hw import get_cpu_monitor
+from livekit.agents.voice.io import TextOutput
 from livekit.plugins import openai
 from livekit.plugins import noise_cancellation  # NOVO: Plugin de cancelamento de ruído
 
+# Opcional: formato compacto do DataChannel (MessagePack)
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
 # CORREÇÃO: Importar TurnDetection do pacote OpenAI
 from openai.types.beta.realtime.session import TurnDetection
+import openai as openai_client  # Cliente OpenAI (avaliação com GPT-4)
+import aiohttp
+import httpx
 
 load_dotenv()
 
 # ============================================================
 # CONFIGURAÇÃO DE LOGGING
 # ============================================================
+# - LOG_FORMAT: "text" (padrão, legível no journald) ou "json" (uma linha
+#   por registro, com room/session_id/customer_id da sessão)
+# - LOG_ASYNC: escreve os logs numa thread separada (QueueHandler), fora
+#   do event loop do áudio
+# - LOG_TRANSCRIPT_SAMPLE_RATE / LOG_STATUS_SAMPLE_RATE: fração (0.0-1.0)
+#   das linhas de transcrição e de status por turno que são registradas
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
-logging.basicConfig(
-    level=getattr(logging, LOG_LEVEL, logging.INFO),
-    format='%(asctime)s | %(levelname)-8s | %(name)s | %(message)s',
-    datefmt='%H:%M:%S'
-)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+LOG_ASYNC = os.getenv("LOG_ASYNC", "true").lower() == "true"
+LOG_TRANSCRIPT_SAMPLE_RATE = float(os.getenv("LOG_TRANSCRIPT_SAMPLE_RATE", "1.0"))
+LOG_STATUS_SAMPLE_RATE = float(os.getenv("LOG_STATUS_SAMPLE_RATE", "1.0"))
+
+# Contexto da sessão do job atual (propagado para as tasks criadas por ela)
+_log_context: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("log_context", default=None)
+
+
+class SessionContextFilter(logging.Filter):
+    """Anexa room/session_id/customer_id da sessão atual a cada registro."""
+
+    FIELDS = ("room", "session_id", "customer_id")
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = _log_context.get() or {}
+        for field in self.FIELDS:
+            if not hasattr(record, field):
+                setattr(record, field, context.get(field))
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Amostra linhas de alta frequência marcadas com extra={"sample": categoria}."""
+
+    def __init__(self, rates: dict):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self.rates.get(getattr(record, "sample", None), 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    """Formata cada registro como uma linha JSON."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for field in SessionContextFilter.FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _LazyQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler que adia a formatação da mensagem para a thread de escrita.
+
+    O `prepare` padrão formata a mensagem antes de enfileirar (pensado para
+    filas entre processos); aqui a fila é local, então o registro vai intacto.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+_log_handlers: list = []  # handlers instalados por setup_logging (os de terceiros ficam)
+
+
+def setup_logging():
+    """Configura o logging do processo principal (formato, escrita assíncrona).
+
+    Chamado no `__main__`, não no import: quem importa o módulo (benchmark,
+    replay, processos de job do LiveKit) mantém os próprios handlers. Os logs
+    dos jobs chegam ao processo principal pelo LiveKit e passam por aqui.
+    """
+    handler = logging.StreamHandler(sys.stdout)
+    if LOG_FORMAT == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(
+            '%(asctime)s | %(levelname)-8s | %(name)s | %(message)s',
+            datefmt='%H:%M:%S'
+        ))
+
+    root = logging.getLogger()
+    root.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+    # Só remove o que uma chamada anterior instalou
+    while _log_handlers:
+        root.removeHandler(_log_handlers.pop())
+
+    if LOG_ASYNC:
+        log_queue = queue.SimpleQueue()
+        listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+        listener.start()
+        atexit.register(listener.stop)
+        handler = _LazyQueueHandler(log_queue)
+    root.addHandler(handler)
+    _log_handlers.append(handler)
+
+
 logger = logging.getLogger("roleplay-agent-realtime")
+# Nível próprio: vale também nos processos de job, onde setup_logging não roda
+logger.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+# Filtros no logger (e não no handler): rodam no processo/contexto que gerou o
+# registro, inclusive quando o LiveKit repassa os logs do job ao processo principal
+logger.addFilter(SamplingFilter({"transcript": LOG_TRANSCRIPT_SAMPLE_RATE, "status": LOG_STATUS_SAMPLE_RATE}))
+logger.addFilter(SessionContextFilter())
+
+
+def log_separator():
+    """Linha separadora dos banners (omitida no formato JSON)."""
+    if LOG_FORMAT != "json":
+        logger.info("=" * 60)
+
 
 logging.getLogger("httpx").setLevel(logging.WARNING)
 logging.getLogger("httpcore").setLevel(logging.WARNING)
@@ -76,6 +218,20 @@ AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID", "")
 AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY", "")
 RECORDING_PATH_PREFIX = os.getenv("RECORDING_PATH_PREFIX", "roleplays/recordings")
 
+# Quando iniciar a gravação em relação à saudação:
+# - serial:   inicia a gravação e só depois fala a saudação (comportamento antigo)
+# - parallel: gravação disparada no start_simulation
+# - prearm:   gravação iniciada assim que a sessão fica PRONTA (padrão)
+# Em parallel/prearm a saudação espera a gravação por até RECORDING_START_GUARD_MS;
+# depois disso segue sem ela (o início da conversa pode não ser gravado)
+RECORDING_START_MODE = os.getenv("RECORDING_START_MODE", "prearm").lower()
+RECORDING_START_GUARD_MS = int(os.getenv("RECORDING_START_GUARD_MS", "1500"))
+
+# Cliente da API LiveKit (Egress) compartilhado entre as gravações
+EGRESS_MAX_CONCURRENCY = int(os.getenv("EGRESS_MAX_CONCURRENCY", "4"))
+EGRESS_MAX_RETRIES = int(os.getenv("EGRESS_MAX_RETRIES", "3"))
+EGRESS_RETRY_BASE_DELAY = float(os.getenv("EGRESS_RETRY_BASE_DELAY", "0.25"))
+
 
 # ============================================================
 # CONFIGURAÇÃO DE NOISE CANCELLATION (BVC)
@@ -92,6 +248,415 @@ RECORDING_PATH_PREFIX = os.getenv("RECORDING_PATH_PREFIX", "roleplays/recordings
 NOISE_CANCELLATION_ENABLED = os.getenv("NOISE_CANCELLATION_ENABLED", "true").lower() == "true"
 
 
+# ============================================================
+# CONFIGURAÇÃO DO CLIENTE DE AVALIAÇÃO (OPENAI)
+# ============================================================
+# Um único cliente por processo, com pool de conexões keep-alive.
+# Retries usam o backoff exponencial com jitter do próprio SDK da OpenAI.
+EVALUATION_MODEL = os.getenv("EVALUATION_MODEL", "gpt-4o")
+EVALUATION_TIMEOUT_SECONDS = float(os.getenv("EVALUATION_TIMEOUT_SECONDS", "60"))
+EVALUATION_CONNECT_TIMEOUT_SECONDS = float(os.getenv("EVALUATION_CONNECT_TIMEOUT_SECONDS", "5"))
+EVALUATION_MAX_RETRIES = int(os.getenv("EVALUATION_MAX_RETRIES", "3"))
+OPENAI_POOL_MAX_CONNECTIONS = int(os.getenv("OPENAI_POOL_MAX_CONNECTIONS", "10"))
+OPENAI_POOL_KEEPALIVE_SECONDS = float(os.getenv("OPENAI_POOL_KEEPALIVE_SECONDS", "120"))
+
+# Avaliação incremental: trechos da conversa são resumidos em background
+# durante a ligação e a avaliação final é enviada em streaming ao frontend.
+INCREMENTAL_EVALUATION_ENABLED = os.getenv("INCREMENTAL_EVALUATION_ENABLED", "true").lower() == "true"
+EVALUATION_NOTES_MODEL = os.getenv("EVALUATION_NOTES_MODEL", "gpt-4o-mini")
+EVALUATION_CHUNK_MESSAGES = int(os.getenv("EVALUATION_CHUNK_MESSAGES", "6"))
+EVALUATION_STREAMING = os.getenv("EVALUATION_STREAMING", "true").lower() == "true"
+EVALUATION_STREAM_INTERVAL_MS = int(os.getenv("EVALUATION_STREAM_INTERVAL_MS", "250"))
+
+# Fila de avaliações (spool SQLite compartilhado entre os processos do worker)
+# - MAX_CONCURRENCY: avaliações simultâneas no worker inteiro
+# - MAX_ATTEMPTS: tentativas antes de desistir (com backoff exponencial)
+# - LEASE_SECONDS: se o job morrer no meio, outra tentativa assume após esse tempo
+# - WEBHOOK_URL: destino do resultado quando a room já não existe
+EVALUATION_SPOOL_PATH = os.getenv("EVALUATION_SPOOL_PATH", "data/evaluations.db")
+EVALUATION_MAX_CONCURRENCY = int(os.getenv("EVALUATION_MAX_CONCURRENCY", "2"))
+EVALUATION_MAX_ATTEMPTS = int(os.getenv("EVALUATION_MAX_ATTEMPTS", "3"))
+EVALUATION_LEASE_SECONDS = float(os.getenv("EVALUATION_LEASE_SECONDS", "180"))
+EVALUATION_QUEUE_POLL_SECONDS = float(os.getenv("EVALUATION_QUEUE_POLL_SECONDS", "2"))
+EVALUATION_WEBHOOK_URL = os.getenv("EVALUATION_WEBHOOK_URL", "")
+
+# Arquivo local de transcrições e avaliações (SQLite WAL, só append)
+# Cada fala e cada avaliação entra no arquivo por uma thread de escrita, em
+# lotes: um fsync por lote a cada FLUSH_MS, nunca no event loop da sessão.
+# No start do worker, sessões interrompidas sem avaliação voltam para a fila.
+# Com o worker rodando, a mesma verificação (e a limpeza por retenção) roda a
+# cada RECOVERY_INTERVAL_SECONDS; uma sessão sem `closed` e com registro nos
+# últimos RECOVERY_IDLE_SECONDS é considerada ativa e fica para depois.
+TRANSCRIPT_STORE_ENABLED = os.getenv("TRANSCRIPT_STORE_ENABLED", "true").lower() == "true"
+TRANSCRIPT_STORE_PATH = os.getenv("TRANSCRIPT_STORE_PATH", "data/transcripts.db")
+TRANSCRIPT_STORE_FLUSH_MS = int(os.getenv("TRANSCRIPT_STORE_FLUSH_MS", "200"))
+TRANSCRIPT_STORE_RETENTION_DAYS = float(os.getenv("TRANSCRIPT_STORE_RETENTION_DAYS", "7"))
+TRANSCRIPT_STORE_RECOVERY_INTERVAL_SECONDS = float(os.getenv("TRANSCRIPT_STORE_RECOVERY_INTERVAL_SECONDS", "300"))
+TRANSCRIPT_STORE_RECOVERY_IDLE_SECONDS = float(os.getenv("TRANSCRIPT_STORE_RECOVERY_IDLE_SECONDS", "900"))
+
+
+# ============================================================
+# CONFIGURAÇÃO DO DATACHANNEL (AGENT → FRONTEND)
+# ============================================================
+# Um único writer por room publica as mensagens em ordem. Dentro da janela
+# de coalescência, mensagens substituídas (status, "replace") são descartadas.
+# - MAX_QUEUE: acima disso, mensagens descartáveis mais antigas são removidas
+# - MAX_PACKET_BYTES: tamanho máximo de um pacote em lote ("batch")
+DATACHANNEL_COALESCE_MS = int(os.getenv("DATACHANNEL_COALESCE_MS", "30"))
+DATACHANNEL_MAX_QUEUE = int(os.getenv("DATACHANNEL_MAX_QUEUE", "500"))
+DATACHANNEL_MAX_PACKET_BYTES = int(os.getenv("DATACHANNEL_MAX_PACKET_BYTES", "15000"))
+# Formato compacto (msgpack): pacotes maiores que isso são comprimidos (zlib)
+DATACHANNEL_COMPRESS_MIN_BYTES = int(os.getenv("DATACHANNEL_COMPRESS_MIN_BYTES", "1024"))
+# Legendas em streaming (ativadas por room via metadata config.streaming_captions)
+CAPTION_INTERVAL_MS = int(os.getenv("CAPTION_INTERVAL_MS", "100"))
+
+
+# ============================================================
+# CONFIGURAÇÃO DO CACHE DE ÁUDIO DA SAUDAÇÃO
+# ============================================================
+# Saudações ("Alô?") são idênticas entre sessões: o áudio PCM é gerado uma
+# vez (TTS da OpenAI, mesma voz) e tocado direto nas próximas sessões.
+GREETING_CACHE_ENABLED = os.getenv("GREETING_CACHE_ENABLED", "true").lower() == "true"
+GREETING_CACHE_DIR = os.getenv(
+    "GREETING_CACHE_DIR", os.path.join(tempfile.gettempdir(), "roleplay-agent-greetings")
+)
+GREETING_CACHE_MAX_FILES = int(os.getenv("GREETING_CACHE_MAX_FILES", "200"))
+GREETING_CACHE_MEMORY_ITEMS = int(os.getenv("GREETING_CACHE_MEMORY_ITEMS", "16"))
+GREETING_TTS_MODEL = os.getenv("GREETING_TTS_MODEL", "gpt-4o-mini-tts")
+
+
+# ============================================================
+# CONFIGURAÇÃO DE CARGA DO WORKER (ADMISSÃO DE JOBS)
+# ============================================================
+# O LiveKit para de enviar novas rooms para este worker quando a carga
+# calculada passa de LOAD_THRESHOLD (0.0-1.0).
+# - MAX_CONCURRENT_SESSIONS: limite rígido de sessões (atingido = carga 1.0)
+# - LOAD_THRESHOLD: também vale para a CPU e para sessões + avaliações
+#   pendentes, que só fecham o worker ao somar MAX_CONCURRENT_SESSIONS
+# - EVALUATION_LOAD_WEIGHT: peso de uma avaliação pendente (em sessões)
+MAX_CONCURRENT_SESSIONS = int(os.getenv("MAX_CONCURRENT_SESSIONS", "4"))
+LOAD_THRESHOLD = float(os.getenv("LOAD_THRESHOLD", "0.75"))
+EVALUATION_LOAD_WEIGHT = float(os.getenv("EVALUATION_LOAD_WEIGHT", "0.5"))
+
+
+# ============================================================
+# MÉTRICAS (PROMETHEUS / OPENMETRICS)
+# ============================================================
+# Endpoint HTTP local com métricas do worker (ex.: http://127.0.0.1:9464/metrics).
+# Cada job roda em um processo separado, então as métricas usam o modo
+# multiprocesso do prometheus_client: cada processo grava em arquivos no
+# PROMETHEUS_MULTIPROC_DIR e o processo principal agrega na leitura.
+# - METRICS_PORT=0 desativa o endpoint
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+# Intervalo da limpeza dos gauges `livesum` de jobs que já terminaram
+METRICS_SWEEP_INTERVAL_S = int(os.getenv("METRICS_SWEEP_INTERVAL_S", "60"))
+EVENT_LOOP_LAG_INTERVAL_MS = int(os.getenv("EVENT_LOOP_LAG_INTERVAL_MS", "500"))
+
+# Watchdog do event loop dos jobs (callbacks lentos = áudio picotado)
+# - LOOP_LAG_WARN_MS: avisa quando o loop atrasa mais que isso
+# - SLOW_CALLBACK_BUDGET_MS: orçamento de cada callback da sessão
+# - LOOP_WATCHDOG_STACK_DUMP: registra a pilha do loop enquanto ele está travado
+LOOP_WATCHDOG_ENABLED = os.getenv("LOOP_WATCHDOG_ENABLED", "true").lower() == "true"
+LOOP_LAG_WARN_MS = int(os.getenv("LOOP_LAG_WARN_MS", "100"))
+SLOW_CALLBACK_BUDGET_MS = int(os.getenv("SLOW_CALLBACK_BUDGET_MS", "20"))
+LOOP_WATCHDOG_STACK_DUMP = os.getenv("LOOP_WATCHDOG_STACK_DUMP", "false").lower() == "true"
+
+if METRICS_PORT > 0:
+    os.environ.setdefault(
+        "PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "roleplay-agent-metrics")
+    )
+    if __name__ == "__main__":
+        # Processo principal: descarta arquivos de execuções anteriores
+        # (precisa acontecer antes do import do prometheus_client)
+        _metrics_dir = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+        os.makedirs(_metrics_dir, exist_ok=True)
+        for _name in os.listdir(_metrics_dir):
+            if _name.endswith(".db"):
+                os.remove(os.path.join(_metrics_dir, _name))
+
+# Opcional: sem prometheus_client as métricas viram no-op
+try:
+    import prometheus_client
+    from prometheus_client import multiprocess as prometheus_multiprocess
+except ImportError:
+    prometheus_client = None
+
+
+class _NoopMetric:
+    """Substituto das métricas quando o prometheus_client não está instalado."""
+
+    def labels(self, *args, **kwargs) -> "_NoopMetric":
+        return self
+
+    def inc(self, amount: float = 1):
+        pass
+
+    def dec(self, amount: float = 1):
+        pass
+
+    def set(self, value: float):
+        pass
+
+    def observe(self, value: float):
+        pass
+
+
+def _metric(kind: str, name: str, documentation: str, **kwargs):
+    if prometheus_client is None:
+        return _NoopMetric()
+    return getattr(prometheus_client, kind)(name, documentation, **kwargs)
+
+
+_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 120)
+
+METRIC_ACTIVE_SESSIONS = _metric(
+    "Gauge", "roleplay_active_sessions", "Sessões de roleplay ativas", multiprocess_mode="livesum"
+)
+METRIC_BVC_SESSIONS = _metric(
+    "Gauge", "roleplay_bvc_sessions", "Sessões ativas com cancelamento de ruído (BVC)", multiprocess_mode="livesum"
+)
+METRIC_SESSION_DURATION = _metric(
+    "Histogram", "roleplay_session_duration_seconds", "Duração das sessões",
+    buckets=(30, 60, 120, 300, 600, 900, 1800, 3600, 7200),
+)
+METRIC_LIVEKIT_API_LATENCY = _metric(
+    "Histogram", "roleplay_livekit_api_latency_seconds",
+    "Latência das chamadas à API do LiveKit (start/stop de gravação, send_data)",
+    labelnames=("operation",), buckets=_LATENCY_BUCKETS,
+)
+METRIC_LIVEKIT_API_FAILURES = _metric(
+    "Counter", "roleplay_livekit_api_failures", "Chamadas à API do LiveKit que falharam após os retries",
+    labelnames=("operation",),
+)
+METRIC_EVALUATION_LATENCY = _metric(
+    "Histogram", "roleplay_evaluation_latency_seconds", "Tempo de geração das avaliações",
+    labelnames=("model",), buckets=_LATENCY_BUCKETS,
+)
+METRIC_EVALUATION_TOKENS = _metric(
+    "Counter", "roleplay_evaluation_tokens", "Tokens consumidos nas avaliações",
+    labelnames=("model", "kind"),
+)
+METRIC_DATACHANNEL_MESSAGES = _metric(
+    "Counter", "roleplay_datachannel_messages", "Mensagens enviadas ao frontend pelo DataChannel"
+)
+METRIC_DATACHANNEL_BYTES = _metric(
+    "Counter", "roleplay_datachannel_bytes", "Bytes publicados no DataChannel"
+)
+METRIC_EVENT_LOOP_LAG = _metric(
+    "Histogram", "roleplay_event_loop_lag_seconds", "Atraso do event loop dos jobs",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+METRIC_REALTIME_TOKENS = _metric(
+    "Counter", "roleplay_realtime_tokens", "Tokens da Realtime API (cached_input = entrada servida do cache de prompt)",
+    labelnames=("kind",),
+)
+METRIC_REALTIME_TTFT = _metric(
+    "Histogram", "roleplay_realtime_ttft_seconds", "Tempo até o primeiro token das respostas da Realtime API",
+    labelnames=("cache",), buckets=(0.1, 0.2, 0.3, 0.5, 0.75, 1, 1.5, 2, 3, 5),
+)
+METRIC_TURN_LATENCY = _metric(
+    "Histogram", "roleplay_turn_latency_seconds",
+    "Latência percebida por turno (response, transcription, greeting)",
+    labelnames=("metric",), buckets=(0.1, 0.25, 0.5, 0.75, 1, 1.5, 2, 3, 5, 10),
+)
+METRIC_SLOW_CALLBACKS = _metric(
+    "Counter", "roleplay_slow_callbacks", "Callbacks do event loop que passaram do orçamento",
+    labelnames=("callback",),
+)
+
+
+def _record_token_usage(model: str, usage) -> None:
+    """Contabiliza o `usage` de uma resposta de chat completions."""
+    if usage is None:
+        return
+    METRIC_EVALUATION_TOKENS.labels(model=model, kind="prompt").inc(usage.prompt_tokens or 0)
+    METRIC_EVALUATION_TOKENS.labels(model=model, kind="completion").inc(usage.completion_tokens or 0)
+    details = getattr(usage, "prompt_tokens_details", None)
+    METRIC_EVALUATION_TOKENS.labels(model=model, kind="cached_prompt").inc(getattr(details, "cached_tokens", 0) or 0)
+
+
+def start_metrics_server() -> bool:
+    """Sobe o endpoint /metrics no processo principal (agrega todos os jobs)."""
+    if METRICS_PORT <= 0:
+        return False
+    if prometheus_client is None:
+        logger.warning("⚠️ METRICS_PORT definido, mas prometheus_client não está instalado")
+        return False
+    registry = prometheus_client.CollectorRegistry()
+    prometheus_multiprocess.MultiProcessCollector(registry)
+    prometheus_client.start_http_server(METRICS_PORT, addr=METRICS_HOST, registry=registry)
+    threading.Thread(target=_run_metrics_sweeper, name="metrics-sweeper", daemon=True).start()
+    logger.info(f"📈 Métricas em http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+    return True
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def sweep_dead_metric_files() -> int:
+    """Limpa os gauges `livesum` de processos que já terminaram.
+
+    Sem isso, os gauges de um job que caiu (ex.: sessões ativas) continuam
+    somando. Só os arquivos `gauge_live*` saem (`mark_process_dead`):
+    contadores e histogramas dos jobs encerrados continuam no agregado.
+    Retorna quantos pids foram limpos.
+    """
+    directory = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if prometheus_client is None or not directory or not os.path.isdir(directory):
+        return 0
+    pids = set()
+    for name in os.listdir(directory):
+        if not (name.startswith("gauge_live") and name.endswith(".db")):
+            continue
+        pid = name[:-3].rsplit("_", 1)[-1]
+        if pid.isdigit():
+            pids.add(int(pid))
+
+    swept = 0
+    for pid in pids:
+        if pid == os.getpid() or _pid_alive(pid):
+            continue
+        try:
+            prometheus_multiprocess.mark_process_dead(pid, directory)
+            swept += 1
+        except OSError as e:
+            logger.warning(f"⚠️ Falha ao limpar métricas do pid {pid}: {e}")
+    return swept
+
+
+def _run_metrics_sweeper():
+    """Thread do processo principal: limpa periodicamente as métricas de jobs encerrados."""
+    while True:
+        time.sleep(max(1, METRICS_SWEEP_INTERVAL_S))
+        try:
+            swept = sweep_dead_metric_files()
+            if swept:
+                logger.info(f"🧹 Gauges de {swept} processo(s) encerrado(s) removidos")
+        except Exception as e:
+            logger.error(f"❌ Erro na limpeza das métricas: {e}")
+
+
+# ============================================================
+# WATCHDOG DO EVENT LOOP (JOB)
+# ============================================================
+
+class LoopWatchdog:
+    """Vigia o event loop do job: atraso (lag) e callbacks lentos.
+
+    Os callbacks da sessão rodam no mesmo loop que o áudio e o BVC; qualquer
+    handler lento vira jitter no áudio. O watchdog:
+    - amostra o lag do loop a cada `interval` e avisa acima de `lag_warn_ms`
+    - mede os callbacks decorados com `timed` e conta os que passam de `callback_budget_ms`
+    - opcionalmente (stack_dump), uma thread captura a pilha do loop enquanto ele está travado
+    """
+
+    def __init__(
+        self,
+        interval: float = EVENT_LOOP_LAG_INTERVAL_MS / 1000,
+        lag_warn_ms: int = LOOP_LAG_WARN_MS,
+        callback_budget_ms: int = SLOW_CALLBACK_BUDGET_MS,
+        stack_dump: bool = LOOP_WATCHDOG_STACK_DUMP,
+    ):
+        self.interval = interval
+        self.lag_warn = lag_warn_ms / 1000
+        self.callback_budget = callback_budget_ms / 1000
+        self.stack_dump = stack_dump
+        self.slow_callbacks: dict = {}
+        self.lag_warnings: int = 0
+        self.max_lag: float = 0.0
+        self.stack_dumps: int = 0
+        self._heartbeat = time.monotonic()
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def timed(self, fn: Callable) -> Callable:
+        """Decorator para callbacks síncronos do loop (mede e reporta os lentos)."""
+        if not LOOP_WATCHDOG_ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - t0
+                if elapsed > self.callback_budget:
+                    self._report_slow(fn.__name__, elapsed)
+
+        return wrapper
+
+    def _report_slow(self, name: str, elapsed: float):
+        self.slow_callbacks[name] = self.slow_callbacks.get(name, 0) + 1
+        METRIC_SLOW_CALLBACKS.labels(callback=name).inc()
+        logger.warning(
+            f"🐢 Callback lento: {name} levou {elapsed * 1000:.0f}ms "
+            f"(orçamento {self.callback_budget * 1000:.0f}ms, {self.slow_callbacks[name]}x)"
+        )
+
+    def start(self):
+        if not LOOP_WATCHDOG_ENABLED or self._task is not None:
+            return
+        self._task = asyncio.create_task(self._sample())
+        if self.stack_dump:
+            self._thread = threading.Thread(
+                target=self._watch, args=(threading.get_ident(),), name="loop-watchdog", daemon=True
+            )
+            self._thread.start()
+
+    async def _sample(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            t0 = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - t0 - self.interval)
+            self._heartbeat = time.monotonic()
+            METRIC_EVENT_LOOP_LAG.observe(lag)
+            self.max_lag = max(self.max_lag, lag)
+            if lag > self.lag_warn:
+                self.lag_warnings += 1
+                logger.warning(f"🐢 Event loop atrasado {lag * 1000:.0f}ms")
+
+    def _watch(self, loop_thread_id: int):
+        """Thread auxiliar: se o loop não der sinal de vida, registra a pilha dele."""
+        dumped_for = None
+        while not self._stop.wait(self.lag_warn):
+            heartbeat = self._heartbeat
+            stalled = time.monotonic() - heartbeat - self.interval
+            if stalled <= self.lag_warn or dumped_for == heartbeat:
+                continue
+            frame = sys._current_frames().get(loop_thread_id)
+            if frame is None:
+                return
+            dumped_for = heartbeat
+            self.stack_dumps += 1
+            stack = "".join(traceback.format_stack(frame))
+            logger.warning(f"🧵 Event loop travado há {stalled * 1000:.0f}ms - pilha atual:\n{stack}")
+
+    def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "max_lag_ms": round(self.max_lag * 1000, 1),
+            "lag_warnings": self.lag_warnings,
+            "slow_callbacks": dict(self.slow_callbacks),
+            "stack_dumps": self.stack_dumps,
+        }
+
+
 # ============================================================
 # MAPEAMENTO DE VOZES PARA REALTIME API
 # ============================================================
@@ -133,7 +698,583 @@ palavra-chave [ENCERRAR_LIGACAO] sozinha em uma nova mensagem.""",
     "time_limit": 30
 }
 
-_sessions: dict = {}
+
+
+# ============================================================
+# CONFIGURAÇÃO DO REGISTRO DE SESSÕES
+# ============================================================
+# TTL: tempo máximo (segundos) sem atividade antes de a sessão ser encerrada pelo teardown
+# MAX_SIZE: limite de sessões no registro (as mais antigas são encerradas pelo teardown)
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "7200"))
+SESSION_REGISTRY_MAX_SIZE = int(os.getenv("SESSION_REGISTRY_MAX_SIZE", "64"))
+
+# Tempo máximo (segundos) aguardando a metadata da room/participante
+METADATA_TIMEOUT_SECONDS = float(os.getenv("METADATA_TIMEOUT_SECONDS", "10"))
+
+# Prazos da sessão: time_limit (minutos, vem na metadata) e silêncio
+# - TIME_LIMIT_WARNING_SECONDS: aviso ao frontend antes do fim
+# - TIME_LIMIT_WRAPUP_SECONDS: antecedência do pedido de despedida à persona
+# - IDLE_TIMEOUT_SECONDS: silêncio (sem fala de ninguém) que encerra a sessão (0 = desativado)
+TIME_LIMIT_WARNING_SECONDS = float(os.getenv("TIME_LIMIT_WARNING_SECONDS", "60"))
+TIME_LIMIT_WRAPUP_SECONDS = float(os.getenv("TIME_LIMIT_WRAPUP_SECONDS", "20"))
+IDLE_TIMEOUT_SECONDS = float(os.getenv("IDLE_TIMEOUT_SECONDS", "120"))
+TIMER_WHEEL_TICK_SECONDS = float(os.getenv("TIMER_WHEEL_TICK_SECONDS", "1"))
+
+# Encerramento da sessão (disconnect/shutdown)
+# - SESSION_TEARDOWN_TIMEOUT_SECONDS: tempo máximo para parar egress, drenar o
+#   DataChannel, enfileirar a avaliação e fechar a sessão Realtime
+# - PARTICIPANT_LEFT_GRACE_SECONDS: espera pela volta do usuário (ex.: refresh)
+#   antes de encerrar o job quando ele sai da room
+SESSION_TEARDOWN_TIMEOUT_SECONDS = float(os.getenv("SESSION_TEARDOWN_TIMEOUT_SECONDS", "10"))
+PARTICIPANT_LEFT_GRACE_SECONDS = float(os.getenv("PARTICIPANT_LEFT_GRACE_SECONDS", "15"))
+
+
+# ============================================================
+# REGISTRO DE SESSÕES (CICLO DE VIDA)
+# ============================================================
+
+class SessionRegistry:
+    """Registro de sessões ativas com ciclo de vida explícito.
+
+    Substitui o antigo dict global `_sessions`: cada room é criada no início
+    do job e removida no disconnect/shutdown. Sessões sem atividade (TTL) ou
+    além do tamanho máximo (LRU) são encerradas pelo próprio teardown
+    (`state["request_teardown"]`, registrado pelo entrypoint), que para o
+    egress, fecha a sessão e remove a entrada. Sessão sem teardown registrado
+    nunca é removida à força: só gera aviso.
+    """
+
+    def __init__(self, ttl_seconds: int = SESSION_TTL_SECONDS, max_size: int = SESSION_REGISTRY_MAX_SIZE):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self.created_count: int = 0
+        self.closed_count: int = 0
+        self.evicted_count: int = 0
+
+    def create(self, room_name: str, config: dict, tm: "TranscriptionManager", rm: "RecordingManager") -> dict:
+        """Cria (ou substitui) a sessão da room e aplica as políticas de remoção."""
+        if room_name in self._entries:
+            replaced = self._entries[room_name]
+            self.close(room_name, reason="replaced")
+            self._request_teardown(room_name, replaced, "replaced")
+
+        self.evict_expired()
+
+        now = time.monotonic()
+        state = {
+            "config": config,
+            "tm": tm,
+            "rm": rm,  # Recording Manager
+            "started": False,
+            "ending": False,
+            "created_at": now,
+            "last_activity": now,
+        }
+        self._entries[room_name] = state
+        self.created_count += 1
+        METRIC_ACTIVE_SESSIONS.inc()
+
+        excess = len(self._entries) - self.max_size
+        for old_room, old_state in list(self._entries.items()):
+            if excess <= 0 or old_state is state:
+                break
+            if old_state.get("teardown") is not None:
+                excess -= 1  # já encerrando
+                continue
+            logger.warning(f"⚠️ Registro acima do limite ({self.max_size}) - encerrando a sessão mais antiga: {old_room}")
+            if self._request_teardown(old_room, old_state, "evicted_size"):
+                excess -= 1
+
+        return state
+
+    def _request_teardown(self, room_name: str, state: dict, reason: str) -> bool:
+        """Encerra a sessão pelo teardown dela (que remove a entrada ao terminar)."""
+        if state.get("teardown") is not None:
+            return True
+        request = state.get("request_teardown")
+        if request is None:
+            logger.warning(f"⚠️ Sessão {room_name} sem teardown registrado - mantida no registro")
+            return False
+        self.evicted_count += 1
+        request(reason)
+        return True
+
+    def get(self, room_name: str) -> Optional[dict]:
+        return self._entries.get(room_name)
+
+    def touch(self, room_name: str):
+        """Marca atividade na sessão (renova TTL e posição no LRU)."""
+        state = self._entries.get(room_name)
+        if state is not None:
+            state["last_activity"] = time.monotonic()
+            self._entries.move_to_end(room_name)
+
+    def close(self, room_name: str, reason: str = "closed", state: Optional[dict] = None) -> bool:
+        """Remove a sessão da room. Retorna False se ela já não existia.
+
+        Se `state` for informado, só remove se a entrada atual for a mesma
+        (evita que o shutdown de um job antigo remova a sessão de um novo job).
+        """
+        current = self._entries.get(room_name)
+        if current is None or (state is not None and current is not state):
+            return False
+        del self._entries[room_name]
+        self.closed_count += 1
+        self._observe_end(current)
+        logger.info(f"🧹 Sessão encerrada: {room_name} ({reason})")
+        logger.info(f"   └─ Registro: {self.stats()}")
+        return True
+
+    def evict_expired(self) -> int:
+        """Encerra (pelo teardown) sessões sem atividade há mais de `ttl_seconds`."""
+        if self.ttl_seconds <= 0:
+            return 0
+        cutoff = time.monotonic() - self.ttl_seconds
+        expired = [
+            (name, state) for name, state in self._entries.items()
+            if state["last_activity"] < cutoff and state.get("teardown") is None
+        ]
+        count = 0
+        for name, state in expired:
+            logger.warning(f"⚠️ Sessão sem atividade há mais de {self.ttl_seconds}s - encerrando: {name}")
+            if self._request_teardown(name, state, "expired"):
+                count += 1
+        return count
+
+    @staticmethod
+    def _observe_end(state: dict):
+        METRIC_ACTIVE_SESSIONS.dec()
+        METRIC_SESSION_DURATION.observe(time.monotonic() - state["created_at"])
+
+    @property
+    def live_count(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        """Retorna contadores do registro."""
+        return {
+            "live": self.live_count,
+            "created": self.created_count,
+            "closed": self.closed_count,
+            "evicted": self.evicted_count,
+        }
+
+    def __contains__(self, room_name: str) -> bool:
+        return room_name in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_registry = SessionRegistry()
+
+
+# ============================================================
+# PRAZOS DA SESSÃO (TIME LIMIT / SILÊNCIO)
+# ============================================================
+
+class TimerWheel:
+    """Timer wheel do worker: agenda callbacks com resolução de `tick` segundos.
+
+    Uma única task avança o ponteiro a cada tick, em vez de uma task (ou
+    `call_later`) por prazo de cada sessão. Agendar e cancelar são O(1).
+    """
+
+    def __init__(self, tick: float = TIMER_WHEEL_TICK_SECONDS, slots: int = 512):
+        self.tick = tick
+        self._slots: list = [dict() for _ in range(slots)]
+        self._cursor = 0
+        self._where: dict = {}  # timer_id -> slot
+        self._next_id = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def schedule(self, delay: float, callback: Callable[[], None]) -> int:
+        """Agenda `callback()` para daqui a `delay` segundos (arredondado para cima no tick)."""
+        ticks = max(1, int(-(-delay // self.tick)))
+        slot = (self._cursor + ticks) % len(self._slots)
+        rounds = (ticks - 1) // len(self._slots)
+        self._next_id += 1
+        self._slots[slot][self._next_id] = [rounds, callback]
+        self._where[self._next_id] = slot
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return self._next_id
+
+    def cancel(self, timer_id: int):
+        slot = self._where.pop(timer_id, None)
+        if slot is not None:
+            self._slots[slot].pop(timer_id, None)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        while self._where:
+            next_tick += self.tick
+            await asyncio.sleep(max(0.0, next_tick - loop.time()))
+            self._advance()
+
+    def _advance(self):
+        self._cursor = (self._cursor + 1) % len(self._slots)
+        entries = self._slots[self._cursor]
+        due = []
+        for timer_id, entry in entries.items():
+            if entry[0] > 0:
+                entry[0] -= 1
+            else:
+                due.append(timer_id)
+        for timer_id in due:
+            callback = entries.pop(timer_id)[1]
+            del self._where[timer_id]
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"❌ Erro em timer da sessão: {e}")
+
+    def __len__(self) -> int:
+        return len(self._where)
+
+
+_timer_wheel = TimerWheel()
+
+
+class SessionTimers:
+    """Prazo (`time_limit`) e silêncio de uma sessão, no timer wheel do worker.
+
+    Sequência para os dois gatilhos: aviso ao frontend (`time_warning`),
+    pedido para a persona se despedir (que normalmente termina com
+    [ENCERRAR_LIGACAO]) e, se a ligação ainda não tiver acabado,
+    `on_expire(reason)` encerra a sessão.
+    """
+
+    def __init__(
+        self,
+        tm: "TranscriptionManager",
+        session: AgentSession,
+        state: dict,
+        on_expire: Callable[[str], None],
+        time_limit_seconds: float,
+        idle_timeout_seconds: float = IDLE_TIMEOUT_SECONDS,
+        wheel: TimerWheel = None,
+    ):
+        self.tm = tm
+        self.session = session
+        self.state = state
+        self.on_expire = on_expire
+        self.time_limit = time_limit_seconds
+        self.idle_timeout = idle_timeout_seconds
+        self.wheel = wheel or _timer_wheel
+        self.last_activity = time.monotonic()
+        self.wrapping_up: Optional[str] = None
+        self._timers: set = set()
+
+    def start(self):
+        """Agenda os prazos a partir de agora (início da simulação)."""
+        self.last_activity = time.monotonic()
+        if self.time_limit > 0:
+            warning_at = max(0.0, self.time_limit - TIME_LIMIT_WARNING_SECONDS)
+            wrapup_at = max(0.0, self.time_limit - TIME_LIMIT_WRAPUP_SECONDS)
+            self._schedule(warning_at, lambda: self._warn("time_limit", self.time_limit - warning_at))
+            self._schedule(wrapup_at, lambda: self._wrap_up("time_limit"))
+            self._schedule(self.time_limit, lambda: self._expire("time_limit"))
+            logger.info(f"⏰ Limite de tempo: {self.time_limit / 60:.0f} min")
+        if self.idle_timeout > 0:
+            self._schedule(self.idle_timeout, self._check_idle)
+
+    def activity(self):
+        """Registra fala (usuário ou IA). Só grava o horário: o timer confere depois."""
+        self.last_activity = time.monotonic()
+
+    def cancel(self):
+        for timer_id in self._timers:
+            self.wheel.cancel(timer_id)
+        self._timers.clear()
+
+    def _schedule(self, delay: float, callback: Callable[[], None]):
+        self._timers.add(self.wheel.schedule(delay, callback))
+
+    def _check_idle(self):
+        # Em vez de reagendar a cada fala, confere o silêncio quando o timer vence
+        idle_for = time.monotonic() - self.last_activity
+        if idle_for < self.idle_timeout:
+            self._schedule(self.idle_timeout - idle_for, self._check_idle)
+            return
+        if self.state["ending"] or self.wrapping_up:
+            return
+        logger.info(f"🔕 Sessão em silêncio há {idle_for:.0f}s")
+        self._warn("idle", TIME_LIMIT_WRAPUP_SECONDS)
+        self._wrap_up("idle")
+        self._schedule(TIME_LIMIT_WRAPUP_SECONDS, lambda: self._expire("idle"))
+
+    def _warn(self, reason: str, remaining: float):
+        if self.state["ending"]:
+            return
+        logger.info(f"⏰ Aviso de encerramento ({reason}): {remaining:.0f}s restantes")
+        self.tm._send_to_frontend("time_warning", {"reason": reason, "remaining_seconds": round(remaining)})
+
+    def _wrap_up(self, reason: str):
+        if self.state["ending"] or self.wrapping_up:
+            return
+        self.wrapping_up = reason
+        asyncio.create_task(self._ask_to_close(reason))
+
+    async def _ask_to_close(self, reason: str):
+        motive = "O tempo da ligação acabou" if reason == "time_limit" else "A ligação ficou em silêncio"
+        try:
+            await self.session.generate_reply(
+                instructions=f"{motive}. Despeça-se de forma educada e natural em uma frase curta "
+                             f"e, em seguida, envie a palavra-chave [ENCERRAR_LIGACAO]."
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ Erro ao pedir encerramento à persona: {e}")
+
+    def _expire(self, reason: str):
+        if self.state["ending"]:
+            return
+        logger.info(f"⏰ Sessão encerrada por {reason}")
+        self.cancel()
+        self.on_expire(reason)
+
+
+# ============================================================
+# CARGA DO WORKER (LOAD_FNC)
+# ============================================================
+
+class WorkerLoadCalculator:
+    """Calcula a carga do worker para o `load_fnc` do LiveKit.
+
+    Combina sessões ativas, avaliações pendentes e uso de CPU (BVC + áudio)
+    em um único valor entre 0.0 e 1.0.
+    """
+
+    def __init__(self, max_sessions: int = MAX_CONCURRENT_SESSIONS, threshold: float = LOAD_THRESHOLD):
+        self.max_sessions = max(max_sessions, 1)
+        self.threshold = threshold
+        self._cpu_monitor = None
+        self._cpu_avg: Optional[float] = None
+        self._overloaded: bool = False
+
+    def _sample_cpu(self) -> float:
+        # Executado pelo LiveKit em thread separada, pode bloquear brevemente
+        if self._cpu_monitor is None:
+            self._cpu_monitor = get_cpu_monitor()
+        cpu = self._cpu_monitor.cpu_percent(interval=0.5)
+        # Média móvel para não oscilar a cada amostra (a primeira amostra é o ponto de partida)
+        self._cpu_avg = cpu if self._cpu_avg is None else 0.7 * self._cpu_avg + 0.3 * cpu
+        return self._cpu_avg
+
+    def __call__(self, worker) -> float:
+        sessions = len(worker.active_jobs)
+        evaluations = _evaluation_spool.count_active()
+        cpu = self._sample_cpu()
+
+        if sessions >= self.max_sessions:
+            # Limite rígido: MAX_CONCURRENT_SESSIONS sessões e nenhuma a mais
+            load = 1.0
+        else:
+            # Sessões + avaliações chegam ao threshold só ao somar max_sessions;
+            # CPU é comparada direto com o threshold
+            session_load = (sessions + EVALUATION_LOAD_WEIGHT * evaluations) / self.max_sessions * self.threshold
+            load = min(max(session_load, cpu), 1.0)
+
+        overloaded = load >= self.threshold
+        if overloaded != self._overloaded:
+            self._overloaded = overloaded
+            if overloaded:
+                logger.warning(f"⚠️ Worker sobrecarregado (load={load:.2f}) - recusando novas rooms")
+            else:
+                logger.info(f"✅ Worker disponível novamente (load={load:.2f})")
+            logger.info(f"   └─ Sessões: {sessions}/{self.max_sessions} | Avaliações: {evaluations} | CPU: {cpu:.0%}")
+
+        return load
+
+
+# ============================================================
+# CLIENTE OPENAI COMPARTILHADO (POOL DE CONEXÕES)
+# ============================================================
+
+class OpenAIClientPool:
+    """Cliente OpenAI do processo com pool HTTP keep-alive e métricas.
+
+    Evita criar um `AsyncOpenAI` (e um pool httpx novo, com DNS + TLS) a
+    cada avaliação. Conta requisições e conexões novas para medir o reuso.
+    """
+
+    def __init__(self):
+        self._client: Optional[openai_client.AsyncOpenAI] = None
+        self.requests: int = 0
+        self.new_connections: int = 0
+
+    def _create(self) -> openai_client.AsyncOpenAI:
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=OPENAI_POOL_MAX_CONNECTIONS,
+                max_keepalive_connections=OPENAI_POOL_MAX_CONNECTIONS,
+                keepalive_expiry=OPENAI_POOL_KEEPALIVE_SECONDS,
+            ),
+            timeout=httpx.Timeout(EVALUATION_TIMEOUT_SECONDS, connect=EVALUATION_CONNECT_TIMEOUT_SECONDS),
+            event_hooks={"request": [self._on_request]},
+        )
+        return openai_client.AsyncOpenAI(
+            http_client=http_client,
+            max_retries=EVALUATION_MAX_RETRIES,
+        )
+
+    async def _on_request(self, request: httpx.Request):
+        self.requests += 1
+        request.extensions["trace"] = self._trace
+
+    async def _trace(self, event_name: str, info: dict):
+        # httpcore só emite connect_tcp quando abre uma conexão nova
+        if event_name == "connection.connect_tcp.complete":
+            self.new_connections += 1
+
+    def get(self) -> openai_client.AsyncOpenAI:
+        if self._client is None or self._client.is_closed():
+            self._client = self._create()
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            try:
+                await self._client.close()
+            except Exception as e:
+                logger.debug("Erro ao fechar cliente OpenAI: %s", e)
+            self._client = None
+            logger.info(f"🔌 Cliente OpenAI fechado - {self.stats()}")
+
+    def stats(self) -> dict:
+        reused = max(self.requests - self.new_connections, 0)
+        return {
+            "requests": self.requests,
+            "new_connections": self.new_connections,
+            "reused_connections": reused,
+            "reuse_ratio": round(reused / self.requests, 2) if self.requests else 0.0,
+        }
+
+
+_openai_pool = OpenAIClientPool()
+
+
+# ============================================================
+# CLIENTE LIVEKIT API COMPARTILHADO (EGRESS)
+# ============================================================
+
+# Códigos Twirp que indicam falha temporária (vale tentar de novo)
+_TWIRP_RETRYABLE_CODES = {"unavailable", "internal", "deadline_exceeded", "resource_exhausted", "unknown"}
+
+
+class LiveKitAPIPool:
+    """Cliente `api.LiveKitAPI` do processo, compartilhado entre RecordingManagers.
+
+    Reaproveita a sessão aiohttp (sem TLS novo a cada start/stop), limita
+    chamadas simultâneas, refaz chamadas com falha temporária (backoff
+    exponencial com jitter) e mede a latência de cada operação.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = EGRESS_MAX_CONCURRENCY,
+        max_retries: int = EGRESS_MAX_RETRIES,
+        base_delay: float = EGRESS_RETRY_BASE_DELAY,
+    ):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self._max_concurrency = max(max_concurrency, 1)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._lkapi: Optional[api.LiveKitAPI] = None
+        self._metrics: dict = {}
+
+    def get(self) -> api.LiveKitAPI:
+        # Criado sob demanda: a sessão aiohttp precisa do event loop do job
+        if self._lkapi is None:
+            self._lkapi = api.LiveKitAPI()
+        return self._lkapi
+
+    @staticmethod
+    def _is_retryable(e: Exception) -> bool:
+        if isinstance(e, api.TwirpError):
+            return getattr(e, "code", None) in _TWIRP_RETRYABLE_CODES
+        return isinstance(e, (asyncio.TimeoutError, aiohttp.ClientError, OSError))
+
+    def _record(self, name: str, elapsed: float, success: bool, attempts: int):
+        m = self._metrics.setdefault(name, {"calls": 0, "failures": 0, "retries": 0, "total_ms": 0.0, "max_ms": 0.0})
+        elapsed_ms = elapsed * 1000
+        m["calls"] += 1
+        m["retries"] += attempts - 1
+        m["total_ms"] += elapsed_ms
+        m["max_ms"] = max(m["max_ms"], elapsed_ms)
+        METRIC_LIVEKIT_API_LATENCY.labels(operation=name).observe(elapsed)
+        if not success:
+            m["failures"] += 1
+            METRIC_LIVEKIT_API_FAILURES.labels(operation=name).inc()
+
+    async def call(
+        self,
+        name: str,
+        fn: Callable[[api.LiveKitAPI], Awaitable],
+        recover: Optional[Callable[[api.LiveKitAPI], Awaitable]] = None,
+    ):
+        """Executa `fn(lkapi)` com concorrência limitada e retry.
+
+        `recover(lkapi)` é chamado antes de cada nova tentativa para tornar a
+        operação idempotente: se retornar algo diferente de None, esse valor
+        é usado como resultado (ex.: o egress já foi criado pela tentativa
+        anterior que deu timeout).
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+
+        t0 = time.perf_counter()
+        attempt = 0
+        async with self._semaphore:
+            while True:
+                attempt += 1
+                try:
+                    if attempt > 1 and recover is not None:
+                        recovered = await recover(self.get())
+                        if recovered is not None:
+                            logger.info(f"♻️ {name}: resultado recuperado da tentativa anterior")
+                            self._record(name, time.perf_counter() - t0, True, attempt)
+                            return recovered
+                    result = await fn(self.get())
+                    elapsed = time.perf_counter() - t0
+                    self._record(name, elapsed, True, attempt)
+                    logger.debug("%s: %.0fms (%d tentativa(s))", name, elapsed * 1000, attempt)
+                    return result
+                except Exception as e:
+                    if attempt > self.max_retries or not self._is_retryable(e):
+                        self._record(name, time.perf_counter() - t0, False, attempt)
+                        raise
+                    delay = self.base_delay * (2 ** (attempt - 1))
+                    delay = random.uniform(0, delay) + delay / 2  # jitter
+                    logger.warning(f"⚠️ {name} falhou ({e}) - nova tentativa em {delay:.2f}s")
+                    await asyncio.sleep(delay)
+
+    async def aclose(self):
+        if self._lkapi is not None:
+            try:
+                await self._lkapi.aclose()
+            except Exception as e:
+                logger.debug("Erro ao fechar cliente LiveKit API: %s", e)
+            self._lkapi = None
+            logger.info(f"🔌 Cliente LiveKit API fechado - {self.stats()}")
+
+    def stats(self) -> dict:
+        """Retorna métricas por operação (chamadas, falhas, retries, latência)."""
+        return {
+            name: {
+                "calls": m["calls"],
+                "failures": m["failures"],
+                "retries": m["retries"],
+                "avg_ms": round(m["total_ms"] / m["calls"], 1) if m["calls"] else 0.0,
+                "max_ms": round(m["max_ms"], 1),
+            }
+            for name, m in self._metrics.items()
+        }
+
+
+_livekit_api_pool = LiveKitAPIPool()
 
 
 # ============================================================
@@ -150,7 +1291,7 @@ class RecordingManager:
         self.egress_id: Optional[str] = None
         self.recording_filepath: Optional[str] = None
         self.is_recording: bool = False
-        self._lkapi: Optional[api.LiveKitAPI] = None
+        self._start_task: Optional[asyncio.Task] = None
 
     def _is_configured(self) -> bool:
         """Verifica se a gravação está configurada corretamente."""
@@ -185,9 +1326,6 @@ class RecordingManager:
             self.recording_filepath = self._generate_filepath()
             logger.info(f"   └─ Filepath: s3://{AWS_BUCKET_NAME}/{self.recording_filepath}")
 
-            # Criar cliente da API LiveKit
-            self._lkapi = api.LiveKitAPI()
-
             # Configurar request de gravação
             # audio_only=True para gravar apenas áudio (menor custo e tamanho)
             req = api.RoomCompositeEgressRequest(
@@ -207,9 +1345,13 @@ class RecordingManager:
                 ],
             )
 
-            # Iniciar gravação via Egress
-            result = await self._lkapi.egress.start_room_composite_egress(req)
-            
+            # Iniciar gravação via Egress (cliente compartilhado com retry)
+            result = await _livekit_api_pool.call(
+                "start_room_composite_egress",
+                lambda lkapi: lkapi.egress.start_room_composite_egress(req),
+                recover=self._find_started_egress,
+            )
+
             self.egress_id = result.egress_id
             self.is_recording = True
 
@@ -226,8 +1368,26 @@ class RecordingManager:
             self.is_recording = False
             return False
 
+    @property
+    def active(self) -> bool:
+        """Gravação ativa ou com início em andamento."""
+        return self.is_recording or (self._start_task is not None and not self._start_task.done())
+
+    def start_recording_task(self) -> asyncio.Task:
+        """Dispara `start_recording()` uma única vez e retorna a task compartilhada."""
+        if self._start_task is None:
+            self._start_task = asyncio.create_task(self.start_recording())
+        return self._start_task
+
     async def stop_recording(self) -> dict:
         """Para a gravação e retorna informações do arquivo."""
+        # Se o início ainda está em andamento, esperar para não deixar egress órfão
+        if self._start_task is not None and not self._start_task.done():
+            try:
+                await self._start_task
+            except Exception:
+                pass
+
         result = {
             "success": False,
             "egress_id": self.egress_id,
@@ -242,176 +1402,1797 @@ class RecordingManager:
             return result
 
         try:
-            logger.info(f"🛑 Parando gravação: {self.egress_id}")
+            logger.info(f"🛑 Parando gravação: {self.egress_id}")
+
+            # Parar o egress (cliente compartilhado com retry)
+            egress_id = self.egress_id
+            stop_result = await _livekit_api_pool.call(
+                "stop_egress",
+                lambda lkapi: lkapi.egress.stop_egress(api.StopEgressRequest(egress_id=egress_id)),
+                recover=self._find_stopped_egress,
+            )
+
+            self.is_recording = False
+
+            # Montar URL do S3
+            s3_url = f"https://{AWS_BUCKET_NAME}.s3.{AWS_REGION}.amazonaws.com/{self.recording_filepath}"
+
+            result["success"] = True
+            result["filepath"] = self.recording_filepath
+            result["s3_url"] = s3_url
+
+            logger.info(f"✅ Gravação finalizada!")
+            logger.info(f"   └─ S3 URL: {s3_url}")
+            logger.info(f"   └─ Status: {stop_result.status}")
+
+        except Exception as e:
+            logger.error(f"❌ Erro ao parar gravação: {e}")
+            result["error"] = str(e)
+
+        return result
+
+    async def _find_started_egress(self, lkapi: api.LiveKitAPI):
+        """Procura um egress ativo desta room com o mesmo filepath (retry idempotente)."""
+        resp = await lkapi.egress.list_egress(api.ListEgressRequest(room_name=self.room_name, active=True))
+        for info in resp.items:
+            outputs = info.room_composite.file_outputs if info.HasField("room_composite") else []
+            if any(o.filepath == self.recording_filepath for o in outputs):
+                return info
+        return None
+
+    async def _find_stopped_egress(self, lkapi: api.LiveKitAPI):
+        """Verifica se o egress já foi parado pela tentativa anterior."""
+        resp = await lkapi.egress.list_egress(api.ListEgressRequest(egress_id=self.egress_id))
+        for info in resp.items:
+            if info.status not in (api.EgressStatus.EGRESS_STARTING, api.EgressStatus.EGRESS_ACTIVE):
+                return info
+        return None
+
+    def get_recording_info(self) -> dict:
+        """Retorna informações da gravação atual."""
+        return {
+            "egress_id": self.egress_id,
+            "filepath": self.recording_filepath,
+            "is_recording": self.is_recording,
+            "room_name": self.room_name,
+            "session_id": self.session_id,
+        }
+
+
+# ============================================================
+# PUBLICADOR DO DATACHANNEL (FILA POR ROOM)
+# ============================================================
+
+# Status que se substituem (só o último pendente importa)
+_STATUS_MESSAGES = {"agent_speaking", "agent_listening"}
+
+# Mensagens que nunca são descartadas quando a fila enche (poucas por sessão)
+_CRITICAL_MESSAGES = {
+    "evaluation",
+    "evaluation_error",
+    "evaluation_queued",
+    "auto_end_simulation",
+    "recording_ready",
+    "time_warning",
+    "config_error",
+}
+
+
+# Formato compacto: códigos curtos no lugar de "type" (campo "t")
+MSG_TYPE_CODES = {
+    "transcription": 1,
+    "agent_speaking": 2,
+    "agent_listening": 3,
+    "evaluation": 4,
+    "evaluation_error": 5,
+    "auto_end_simulation": 6,
+    "recording_ready": 7,
+    "evaluation_notes": 8,
+    "evaluation_partial": 9,
+    "evaluation_queued": 10,
+    "batch": 11,
+    "caption": 12,
+    "caption_commit": 13,
+    "time_warning": 14,
+    "config_error": 15,
+}
+
+# Primeiro byte de cada pacote no formato compacto
+_FRAME_MSGPACK = 0x00
+_FRAME_MSGPACK_ZLIB = 0x01
+_FRAME_CHUNK = 0x02
+
+
+def _compact_message(message: dict) -> dict:
+    """Troca "type" pelo código curto "t" (tipos desconhecidos ficam como estão)."""
+    code = MSG_TYPE_CODES.get(message.get("type"))
+    if code is None:
+        return message
+    compact = {k: v for k, v in message.items() if k != "type"}
+    compact["t"] = code
+    return compact
+
+
+def _end_marker_prefix_len(text: str) -> int:
+    """Tamanho do maior sufixo de `text` que é início do marcador [ENCERRAR_LIGACAO]."""
+    marker = "[ENCERRAR_LIGACAO]"
+    for size in range(min(len(marker) - 1, len(text)), 0, -1):
+        if text.endswith(marker[:size]):
+            return size
+    return 0
+
+
+def _coalesce_key(message: dict) -> Optional[str]:
+    """Chave de coalescência: mensagens pendentes com a mesma chave são substituídas."""
+    msg_type = message.get("type")
+    if msg_type in _STATUS_MESSAGES:
+        return "status"
+    if msg_type == "transcription" and message.get("replace"):
+        return f"replace:{message.get('role')}:{message.get('id')}"
+    if msg_type == "caption" and "text" in message:
+        # Legenda parcial do usuário traz o texto completo até agora
+        return f"caption:{message.get('role')}:{message.get('turn')}"
+    return None
+
+
+class DataChannelPublisher:
+    """Fila de saída do DataChannel com um único writer por room.
+
+    Preserva a ordem, coalesce mensagens substituídas dentro de uma janela
+    curta, agrupa várias mensagens em um pacote quando o frontend aceita
+    (`batch`) e expõe métricas de profundidade da fila e descartes.
+    """
+
+    def __init__(
+        self,
+        room: rtc.Room,
+        coalesce_ms: int = DATACHANNEL_COALESCE_MS,
+        max_queue: int = DATACHANNEL_MAX_QUEUE,
+        max_packet_bytes: int = DATACHANNEL_MAX_PACKET_BYTES,
+    ):
+        self.room = room
+        self.coalesce_window = coalesce_ms / 1000
+        self.max_queue = max_queue
+        self.max_packet_bytes = max_packet_bytes
+        self.batching: bool = False  # habilitado pelo frontend no start_simulation
+        self.encoding: str = "json"  # "json" (padrão) ou "msgpack", negociado no start_simulation
+        self._chunk_id: int = 0
+        self._queue: deque = deque()
+        self._wakeup = asyncio.Event()
+        self._writer: Optional[asyncio.Task] = None
+        self._closed: bool = False
+        self._in_flight: bool = False  # pacote já retirado da fila e ainda sendo enviado
+        self.metrics = {
+            "enqueued": 0,
+            "coalesced": 0,
+            "dropped": 0,
+            "packets": 0,
+            "messages": 0,
+            "bytes": 0,
+            "errors": 0,
+            "max_depth": 0,
+        }
+
+    def send(self, message: dict):
+        """Enfileira uma mensagem (não bloqueia o event loop)."""
+        if self._closed:
+            return
+        if self._writer is None:
+            self._writer = asyncio.create_task(self._run())
+
+        key = _coalesce_key(message)
+        if key is not None:
+            # Substitui no lugar, mantendo a posição da mensagem original na fila
+            for index in range(len(self._queue) - 1, -1, -1):
+                if _coalesce_key(self._queue[index]) == key:
+                    self._queue[index] = message
+                    self.metrics["coalesced"] += 1
+                    self._wakeup.set()
+                    return
+
+        if len(self._queue) >= self.max_queue:
+            self._drop_oldest()
+
+        self._queue.append(message)
+        self.metrics["enqueued"] += 1
+        self.metrics["max_depth"] = max(self.metrics["max_depth"], len(self._queue))
+        self._wakeup.set()
+
+    def _drop_oldest(self):
+        # Descarta primeiro o que é substituível (status, replace) e depois a
+        # mensagem não crítica mais antiga; as críticas são poucas por sessão,
+        # então a fila continua limitada mesmo quando só restam elas
+        victim = next((m for m in self._queue if _coalesce_key(m) is not None), None)
+        if victim is None:
+            victim = next((m for m in self._queue if m.get("type") not in _CRITICAL_MESSAGES), None)
+        if victim is None:
+            return
+        self._queue.remove(victim)
+        self.metrics["dropped"] += 1
+
+    def set_encoding(self, encoding: str) -> str:
+        """Define o formato negociado com o frontend. Retorna o formato em uso."""
+        encoding = (encoding or "json").lower()
+        if encoding == "msgpack" and msgpack is None:
+            logger.warning("⚠️ Frontend pediu msgpack, mas o pacote não está instalado - usando JSON")
+            encoding = "json"
+        self.encoding = encoding if encoding in ("json", "msgpack") else "json"
+        return self.encoding
+
+    def _encode_one(self, message: dict) -> bytes:
+        if self.encoding == "msgpack":
+            return msgpack.packb(_compact_message(message), use_bin_type=True)
+        return json.dumps(message).encode("utf-8")
+
+    def _encode(self, parts: list) -> list:
+        """Monta os pacotes a partir das mensagens já codificadas (`_encode_one`)."""
+        if self.encoding != "msgpack":
+            if len(parts) == 1:
+                return [parts[0]]
+            # Mesmo resultado de json.dumps({"type": "batch", "messages": [...]})
+            return [b'{"type": "batch", "messages": [' + b", ".join(parts) + b"]}"]
+
+        if len(parts) == 1:
+            body = parts[0]
+        else:
+            # {"t": batch, "messages": [...]} reaproveitando os bytes de cada mensagem
+            packer = msgpack.Packer(use_bin_type=True)
+            body = b"".join([
+                packer.pack_map_header(2),
+                packer.pack("t"), packer.pack(MSG_TYPE_CODES["batch"]),
+                packer.pack("messages"), packer.pack_array_header(len(parts)),
+                *parts,
+            ])
+
+        frame = bytes([_FRAME_MSGPACK]) + body
+        if len(body) >= DATACHANNEL_COMPRESS_MIN_BYTES:
+            compressed = zlib.compress(body, 6)
+            if len(compressed) < len(body):
+                frame = bytes([_FRAME_MSGPACK_ZLIB]) + compressed
+
+        if len(frame) <= self.max_packet_bytes:
+            return [frame]
+
+        # Payload grande (ex.: avaliação): dividir em pedaços numerados
+        self._chunk_id += 1
+        size = self.max_packet_bytes - 64
+        chunks = [frame[i:i + size] for i in range(0, len(frame), size)]
+        return [
+            bytes([_FRAME_CHUNK]) + msgpack.packb(
+                {"id": self._chunk_id, "i": index, "n": len(chunks), "d": chunk}, use_bin_type=True
+            )
+            for index, chunk in enumerate(chunks)
+        ]
+
+    def encode_message(self, message: dict) -> list:
+        """Codifica uma mensagem avulsa nos pacotes do formato negociado (com chunks)."""
+        return self._encode([self._encode_one(message)])
+
+    def _take_packet(self) -> list:
+        """Retira da fila as mensagens do próximo pacote e o codifica."""
+        parts = [self._encode_one(self._queue.popleft())]
+        if self.batching:
+            # Cada mensagem é codificada uma única vez: os bytes medem o lote e o compõem
+            total = len(parts[0])
+            while self._queue:
+                part = self._encode_one(self._queue[0])
+                if total + len(part) + 32 > self.max_packet_bytes:
+                    break
+                self._queue.popleft()
+                parts.append(part)
+                total += len(part)
+        self.metrics["messages"] += len(parts)
+        METRIC_DATACHANNEL_MESSAGES.inc(len(parts))
+        return self._encode(parts)
+
+    async def _publish(self, packets: list):
+        for payload in packets:
+            await self.room.local_participant.publish_data(payload, reliable=True)
+            self.metrics["packets"] += 1
+            self.metrics["bytes"] += len(payload)
+            METRIC_DATACHANNEL_BYTES.inc(len(payload))
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            if self.coalesce_window > 0 and not self._closed:
+                await asyncio.sleep(self.coalesce_window)
+            while self._queue:
+                self._in_flight = True
+                try:
+                    packets = self._take_packet()
+                    try:
+                        await self._publish(packets)
+                    except Exception as e:
+                        if len(packets) == 1:
+                            raise
+                        # Falha no meio de um conjunto de chunks: reenvia o conjunto
+                        # inteiro (mesmo id, o frontend sobrescreve os pedaços já recebidos)
+                        self.metrics["errors"] += 1
+                        logger.warning(f"⚠️ Falha ao enviar chunks ({e}) - reenviando o conjunto ({len(packets)} pedaços)")
+                        await self._publish(packets)
+                except Exception as e:
+                    # Sem segunda tentativa: a mensagem (ou o conjunto de chunks) é abandonada inteira
+                    self.metrics["errors"] += 1
+                    logger.error(f"❌ Erro ao enviar para frontend: {e}")
+                finally:
+                    self._in_flight = False
+
+    @property
+    def depth(self) -> int:
+        return len(self._queue)
+
+    def stats(self) -> dict:
+        return {"depth": self.depth, **self.metrics}
+
+    async def aclose(self, timeout: float = 2.0):
+        """Envia o que estiver pendente (com limite de tempo) e encerra o writer."""
+        self._closed = True
+        if self._writer is None:
+            return
+        deadline = time.monotonic() + timeout
+        # Espera também o pacote em andamento (ex.: a avaliação final já retirada da fila)
+        while (self._queue or self._in_flight) and time.monotonic() < deadline:
+            self._wakeup.set()
+            await asyncio.sleep(0.05)
+        self._writer.cancel()
+        try:
+            await self._writer
+        except (asyncio.CancelledError, Exception):
+            pass
+        self._writer = None
+
+
+# ============================================================
+# MEDIÇÃO DE LATÊNCIA (POR TURNO)
+# ============================================================
+
+def _percentile(sorted_values: list, pct: float) -> float:
+    """Percentil por nearest-rank (lista já ordenada)."""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class LatencyStats:
+    """Amostras de latência (ms) por métrica, com resumo p50/p95/p99."""
+
+    def __init__(self, max_samples: int = 1000):
+        self._samples: dict = {}
+        self.max_samples = max_samples
+
+    def record(self, metric: str, value_ms: float):
+        self._samples.setdefault(metric, deque(maxlen=self.max_samples)).append(value_ms)
+
+    def summary(self) -> dict:
+        result = {}
+        for metric, values in self._samples.items():
+            ordered = sorted(values)
+            result[metric] = {
+                "count": len(ordered),
+                "p50": round(_percentile(ordered, 50)),
+                "p95": round(_percentile(ordered, 95)),
+                "p99": round(_percentile(ordered, 99)),
+                "max": round(ordered[-1]),
+            }
+        return result
+
+
+class LatencyTracker:
+    """Mede, turno a turno, a latência percebida pelo usuário.
+
+    - response:      fim da fala do usuário → IA começa a falar
+    - transcription: fim da fala do usuário → transcrição final chega
+    - greeting:      pedido da saudação → IA começa a falar
+    """
+
+    def __init__(self):
+        self.stats = LatencyStats()
+        self._user_stopped_at: Optional[float] = None
+        self._transcribed: bool = False
+        self._greeting_requested_at: Optional[float] = None
+
+    def _record(self, metric: str, started_at: float) -> float:
+        elapsed_ms = (time.perf_counter() - started_at) * 1000
+        self.stats.record(metric, elapsed_ms)
+        # Agregado entre sessões/jobs: histograma no endpoint do processo principal
+        METRIC_TURN_LATENCY.labels(metric=metric).observe(elapsed_ms / 1000)
+        return elapsed_ms
+
+    def user_stopped_speaking(self):
+        self._user_stopped_at = time.perf_counter()
+        self._transcribed = False
+
+    def transcription_received(self):
+        if self._user_stopped_at is not None and not self._transcribed:
+            self._transcribed = True
+            self._record("transcription", self._user_stopped_at)
+
+    def greeting_requested(self):
+        self._greeting_requested_at = time.perf_counter()
+
+    def agent_started_speaking(self):
+        if self._greeting_requested_at is not None:
+            elapsed = self._record("greeting", self._greeting_requested_at)
+            logger.info(f"⏱️ Saudação: {elapsed:.0f}ms até o primeiro áudio")
+            self._greeting_requested_at = None
+        elif self._user_stopped_at is not None:
+            elapsed = self._record("response", self._user_stopped_at)
+            logger.info("⏱️ Latência: %.0fms (fim da fala → áudio da IA)", elapsed, extra={"sample": "status"})
+        self._user_stopped_at = None
+
+    def summary(self) -> dict:
+        return self.stats.summary()
+
+
+# ============================================================
+# CLASSE GERENCIADORA DE TRANSCRIÇÃO
+# ============================================================
+
+class TranscriptionManager:
+    """Gerencia transcrições de forma centralizada."""
+
+    def __init__(self, room: rtc.Room, room_name: str):
+        self.room = room
+        self.room_name = room_name
+        self.publisher = DataChannelPublisher(room)
+        self.latency = LatencyTracker()
+        self.history: list = []
+        self._last_user_text: str = ""
+        self._ai_items: dict = {}  # id do item → índice no histórico
+        self._turn: int = 0
+        self._turn_item: Optional[str] = None  # última fala da IA no turno atual
+        self.append_deltas: bool = False  # frontend aceita "append" (negociado no start_simulation)
+        self._greeting_sent: bool = False
+        # Legendas em streaming (parciais do usuário + deltas da IA)
+        self.captions_enabled: bool = False
+        self._caption_seq: int = 0
+        self._caption_turns: dict = {"user": None, "ai": None}
+        self._caption_user_text: Optional[str] = None
+        self._caption_ai_buffer: list = []
+        self._caption_timer: Optional[asyncio.TimerHandle] = None
+        self._listeners: list = []
+        # Arquivo local (TranscriptStore): cada alteração do histórico vira um registro
+        self._store: Optional["TranscriptStore"] = None
+        self.store_key: Optional[str] = None
+
+    def attach_store(self, store: "TranscriptStore", key: str):
+        """Grava o histórico desta sessão no arquivo local, sob a chave `key`."""
+        self._store = store
+        self.store_key = key
+
+    def record(self, kind: str, data: dict = None):
+        """Registra um evento da sessão no arquivo local (não bloqueia)."""
+        if self._store is not None:
+            self._store.append(self.store_key, kind, data)
+
+    def _persist(self, index: int):
+        msg = self.history[index]
+        self.record("message", {"index": index, "role": msg["role"], "content": msg["content"]})
+
+    def add_listener(self, callback: Callable[[dict], None]):
+        """Registra callback chamado a cada nova mensagem no histórico."""
+        self._listeners.append(callback)
+
+    def _notify(self, msg: dict):
+        for callback in self._listeners:
+            try:
+                callback(msg)
+            except Exception as e:
+                logger.error(f"❌ Erro em listener de transcrição: {e}")
+
+    def add_user_message(self, text: str) -> bool:
+        """Adiciona mensagem do usuário."""
+        if not text or len(text.strip()) < 2:
+            return False
+        text = text.strip()
+        if text == self._last_user_text:
+            return False
+        self._last_user_text = text
+        if self._caption_turns["user"] is not None:
+            self.commit_caption("user")
+        # Fala do usuário fecha o turno da IA (eventos sem id não mesclam mais)
+        self._turn += 1
+        self._turn_item = None
+        logger.info("👤 USUÁRIO: %s", text, extra={"sample": "transcript"})
+        self.history.append({"role": "user", "content": text})
+        self._send_to_frontend("transcription", {"role": "user", "text": text})
+        self._persist(len(self.history) - 1)
+        self._notify(self.history[-1])
+        return True
+
+    def add_ai_message(self, text: str, item_id: Optional[str] = None) -> bool:
+        """Adiciona fala da IA, montando fragmentos pelo id do item da conversa.
+
+        Eventos repetidos, fora de ordem ou parciais do mesmo item são
+        mesclados sem varrer o texto: só comparações de prefixo/sufixo com
+        o texto já conhecido daquele item. Retorna True se houver sinal de
+        encerramento.
+        """
+        if not text or len(text.strip()) < 2:
+            return False
+        text = text.strip()
+
+        end_signal = "[ENCERRAR_LIGACAO]" in text
+        if end_signal:
+            text = text.replace("[ENCERRAR_LIGACAO]", "").strip()
+            if not text:
+                return True
+
+        key = item_id or self._turn_item
+        index = self._ai_items.get(key) if key else None
+
+        if index is None:
+            self._new_ai_item(item_id, text)
+            return end_signal
+
+        stored = self.history[index]["content"]
+        if text == stored or stored.startswith(text) or stored.endswith(text):
+            # Duplicado ou fragmento antigo chegando fora de ordem
+            return end_signal
+
+        if text.startswith(stored):
+            # Continuação do mesmo item: enviar só o texto novo
+            self.history[index]["content"] = text
+            self._persist(index)
+            if self.append_deltas:
+                self._send_to_frontend("transcription", {"role": "ai", "text": text[len(stored):], "append": True, "id": key})
+            else:
+                self._send_to_frontend("transcription", {"role": "ai", "text": text, "replace": True, "id": key})
+            return end_signal
+
+        if item_id:
+            # Mesmo item com texto corrigido
+            logger.debug("📝 Substituindo texto do item %s", item_id)
+            self.history[index]["content"] = text
+            self._persist(index)
+            self._send_to_frontend("transcription", {"role": "ai", "text": text, "replace": True, "id": key})
+        else:
+            # Sem id e sem relação com a fala anterior: nova fala no mesmo turno
+            self._new_ai_item(None, text)
+        return end_signal
+
+    def _new_ai_item(self, item_id: Optional[str], text: str):
+        """Adiciona uma nova fala da IA ao histórico."""
+        key = item_id or f"turn-{self._turn}-{len(self.history)}"
+        self._ai_items[key] = len(self.history)
+        self._turn_item = key
+        logger.info("🤖 IA: %s", text, extra={"sample": "transcript"})
+        self.history.append({"role": "assistant", "content": text})
+        self._send_to_frontend("transcription", {"role": "ai", "text": text, "id": key})
+        self._persist(len(self.history) - 1)
+        self._notify(self.history[-1])
+
+    def _caption_turn(self, role: str) -> str:
+        turn = self._caption_turns[role]
+        if turn is None:
+            self._caption_seq += 1
+            turn = f"{role[0]}-{self._caption_seq}"
+            self._caption_turns[role] = turn
+        return turn
+
+    def caption_user(self, text: str):
+        """Legenda parcial do usuário (texto acumulado até agora)."""
+        if not self.captions_enabled or not text:
+            return
+        self._caption_turn("user")
+        self._caption_user_text = text.strip()
+        self._schedule_captions()
+
+    def caption_ai_delta(self, delta: str):
+        """Trecho novo da fala da IA (sincronizado com o áudio)."""
+        if not self.captions_enabled or not delta:
+            return
+        self._caption_turn("ai")
+        # O marcador é removido no texto juntado: ele pode vir quebrado entre deltas
+        self._caption_ai_buffer.append(delta)
+        self._schedule_captions()
+
+    def commit_caption(self, role: str):
+        """Fecha o turno de legenda do papel (`user` ou `ai`)."""
+        turn = self._caption_turns[role]
+        if turn is None:
+            return
+        self._flush_captions(final=role == "ai")
+        self._caption_turns[role] = None
+        self._send_to_frontend("caption_commit", {"role": role, "turn": turn})
+
+    def _schedule_captions(self):
+        # Um timer por sessão: agrupa deltas em vez de um pacote por token
+        if self._caption_timer is None:
+            self._caption_timer = asyncio.get_running_loop().call_later(
+                CAPTION_INTERVAL_MS / 1000, self._flush_captions
+            )
+
+    def _flush_captions(self, final: bool = False):
+        if self._caption_timer is not None:
+            self._caption_timer.cancel()
+            self._caption_timer = None
+        if self._caption_user_text:
+            self._send_to_frontend("caption", {"role": "user", "turn": self._caption_turns["user"], "text": self._caption_user_text})
+            self._caption_user_text = None
+        if self._caption_ai_buffer:
+            delta = "".join(self._caption_ai_buffer).replace("[ENCERRAR_LIGACAO]", "")
+            self._caption_ai_buffer = []
+            # Segura um possível início do marcador no fim (ex.: "[ENCER") até o
+            # próximo delta ou o fechamento do turno
+            held = 0 if final else _end_marker_prefix_len(delta)
+            if held:
+                self._caption_ai_buffer.append(delta[-held:])
+                delta = delta[:-held]
+            if delta:
+                self._send_to_frontend("caption", {"role": "ai", "turn": self._caption_turns["ai"], "delta": delta})
+
+    def flush(self):
+        """Fecha as legendas em aberto (encerramento da sessão)."""
+        self.commit_caption("user")
+        self.commit_caption("ai")
+        self._flush_captions()
+
+    def check_for_end_signal(self, text: str) -> bool:
+        """Verifica se o texto contém sinal de encerramento."""
+        return "[ENCERRAR_LIGACAO]" in text
+
+    def _send_to_frontend(self, msg_type: str, data: dict = None):
+        """Envia mensagem para o frontend via DataChannel (fila ordenada)."""
+        try:
+            message = {"type": msg_type}
+            if data:
+                message.update(data)
+            self.publisher.send(message)
+        except Exception as e:
+            logger.error(f"❌ Erro ao enviar para frontend: {e}")
+
+    def send_status(self, status: str):
+        self._send_to_frontend(status)
+
+    def send_error(self, message: str):
+        self._send_to_frontend("evaluation_error", {"message": message})
+
+    def send_evaluation(self, evaluation: dict, recording_info: dict = None, latency: dict = None):
+        """Envia avaliação com informações da gravação e resumo de latência."""
+        data = {"data": evaluation}
+        if recording_info:
+            data["recording"] = recording_info
+        if latency:
+            data["latency"] = latency
+        self._send_to_frontend("evaluation", data)
+    
+    def send_auto_end(self, recording_info: dict = None, reason: str = "ai_ended"):
+        """Notifica o frontend que a ligação foi encerrada pelo agent (IA, tempo ou silêncio)."""
+        logger.info(f"📞 Encerramento da ligação pelo agent ({reason})")
+        data = {"reason": reason}
+        if recording_info:
+            data["recording"] = recording_info
+        self._send_to_frontend("auto_end_simulation", data)
+
+    def send_recording_ready(self, recording_info: dict):
+        """Envia dados da gravação para o frontend."""
+        logger.info(f"📼 Enviando dados de gravação: {recording_info.get('s3_url', 'N/A')}")
+        self._send_to_frontend("recording_ready", recording_info)
+
+    def get_history(self) -> list:
+        return self.history.copy()
+
+
+class CaptionTextOutput(TextOutput):
+    """Saída de texto da sessão que repassa os deltas da IA como legendas.
+
+    Encadeada antes da saída original (transcrição da room), que continua
+    recebendo tudo normalmente.
+    """
+
+    def __init__(self, tm: TranscriptionManager, next_in_chain: Optional[TextOutput] = None):
+        super().__init__(label="RoleplayCaptions", next_in_chain=next_in_chain)
+        self.tm = tm
+
+    async def capture_text(self, text: str) -> None:
+        self.tm.caption_ai_delta(text)
+        if self.next_in_chain is not None:
+            await self.next_in_chain.capture_text(text)
+
+    def flush(self) -> None:
+        self.tm.commit_caption("ai")
+        if self.next_in_chain is not None:
+            self.next_in_chain.flush()
+
+
+# ============================================================
+# CACHE DE ÁUDIO DA SAUDAÇÃO
+# ============================================================
+
+class GreetingAudioCache:
+    """Cache de áudio PCM das saudações, chaveado por (texto, voz).
+
+    Dois níveis: memória (LRU pequeno, sem I/O) e disco (LRU por mtime).
+    Formato: PCM 16-bit mono 24kHz, o mesmo da saída da Realtime API.
+    """
+
+    SAMPLE_RATE = 24000
+    NUM_CHANNELS = 1
+    FRAME_MS = 20
+
+    def __init__(
+        self,
+        directory: str = GREETING_CACHE_DIR,
+        max_files: int = GREETING_CACHE_MAX_FILES,
+        memory_items: int = GREETING_CACHE_MEMORY_ITEMS,
+    ):
+        self.directory = directory
+        self.max_files = max_files
+        self.memory_items = memory_items
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._rendering: set = set()
+        self.hits: int = 0
+        self.misses: int = 0
+
+    @staticmethod
+    def key(text: str, voice: str) -> str:
+        return hashlib.sha256(f"{voice}\n{text}".encode("utf-8")).hexdigest()[:32]
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.pcm")
+
+    def _remember(self, key: str, pcm: bytes):
+        self._memory[key] = pcm
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _read_disk(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                pcm = f.read()
+            os.utime(path)  # marca uso recente para o LRU do disco
+            return pcm or None
+        except OSError:
+            return None
+
+    def _write_disk(self, key: str, pcm: bytes):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self._path(key) + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(pcm)
+        os.replace(tmp_path, self._path(key))
+
+        files = [e for e in os.scandir(self.directory) if e.name.endswith(".pcm")]
+        if len(files) > self.max_files:
+            files.sort(key=lambda e: e.stat().st_mtime)
+            for entry in files[:len(files) - self.max_files]:
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+
+    def preload(self, text: str, voice: str) -> bool:
+        """Carrega uma saudação do disco para a memória (uso no prewarm)."""
+        key = self.key(text, voice)
+        pcm = self._read_disk(key)
+        if pcm:
+            self._remember(key, pcm)
+        return pcm is not None
+
+    async def get(self, text: str, voice: str) -> Optional[bytes]:
+        key = self.key(text, voice)
+        pcm = self._memory.get(key)
+        if pcm is None:
+            pcm = await asyncio.to_thread(self._read_disk, key)
+        if pcm is None:
+            self.misses += 1
+            return None
+        self._remember(key, pcm)
+        self.hits += 1
+        return pcm
+
+    async def render(self, text: str, voice: str):
+        """Gera o áudio da saudação via TTS e grava no cache (em background)."""
+        key = self.key(text, voice)
+        if key in self._rendering:
+            return
+        self._rendering.add(key)
+        try:
+            response = await get_openai_client().audio.speech.create(
+                model=GREETING_TTS_MODEL,
+                voice=voice,
+                input=text,
+                response_format="pcm",
+            )
+            pcm = response.content
+            await asyncio.to_thread(self._write_disk, key, pcm)
+            self._remember(key, pcm)
+            logger.info(f"💾 Saudação em cache: '{text}' ({voice}, {len(pcm)} bytes)")
+        except Exception as e:
+            logger.warning(f"⚠️ Não foi possível gerar cache da saudação: {e}")
+        finally:
+            self._rendering.discard(key)
+
+    async def frames(self, pcm: bytes):
+        """Converte o PCM em AudioFrames de 20ms para `session.say(audio=...)`."""
+        samples_per_frame = self.SAMPLE_RATE * self.FRAME_MS // 1000
+        frame_bytes = samples_per_frame * self.NUM_CHANNELS * 2
+        for offset in range(0, len(pcm), frame_bytes):
+            chunk = pcm[offset:offset + frame_bytes]
+            if len(chunk) < frame_bytes:
+                chunk += b"\x00" * (frame_bytes - len(chunk))
+            yield rtc.AudioFrame(
+                data=chunk,
+                sample_rate=self.SAMPLE_RATE,
+                num_channels=self.NUM_CHANNELS,
+                samples_per_channel=samples_per_frame,
+            )
+
+
+_greeting_cache = GreetingAudioCache()
+
+
+# ============================================================
+# AVALIAÇÃO INCREMENTAL
+# ============================================================
+
+class IncrementalEvaluator:
+    """Resume a conversa em trechos enquanto ela acontece.
+
+    A cada `chunk_messages` novas mensagens, um modelo menor gera notas de
+    avaliação do trecho em background (uma chamada por vez). As notas são
+    enviadas ao frontend (`evaluation_notes`) e, na avaliação final, entram
+    no lugar das mensagens que já resumiram (`_checkpoint`).
+    """
+
+    def __init__(self, tm: "TranscriptionManager", config: dict, chunk_messages: int = EVALUATION_CHUNK_MESSAGES):
+        self.tm = tm
+        self.config = config
+        self.chunk_messages = max(chunk_messages, 2)
+        self.notes: list = []
+        self._checkpoint: int = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def on_message(self, msg: dict):
+        if self._task is not None and not self._task.done():
+            return
+        end = len(self.tm.history)
+        if end - self._checkpoint >= self.chunk_messages:
+            self._task = asyncio.create_task(self._summarize(self._checkpoint, end))
+
+    async def _summarize(self, start: int, end: int):
+        criteria = self.config.get("criteria") or []
+        criteria_text = "\n".join(f"- {c.get('name', c) if isinstance(c, dict) else c}" for c in criteria)
+        prompt = (
+            "Você está acompanhando um roleplay de vendas/atendimento em andamento. "
+            "Resuma em no máximo 5 tópicos curtos o desempenho do PARTICIPANTE neste trecho, "
+            "citando pontos fortes, falhas e momentos relevantes para a avaliação final."
+        )
+        if criteria_text:
+            prompt += f"\n\nCritérios de avaliação:\n{criteria_text}"
+        prompt += f"\n\nTRECHO:\n{_format_conversation(self.tm.history[start:end])}"
+
+        try:
+            response = await get_openai_client().chat.completions.create(
+                model=EVALUATION_NOTES_MODEL,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.2,
+                max_tokens=300,
+            )
+            _record_token_usage(EVALUATION_NOTES_MODEL, response.usage)
+            notes = (response.choices[0].message.content or "").strip()
+        except Exception as e:
+            logger.warning(f"⚠️ Erro ao resumir trecho {start}-{end}: {e}")
+            return
+
+        if notes:
+            self.notes.append(notes)
+            self.tm._send_to_frontend("evaluation_notes", {"turns": end, "notes": notes})
+            logger.info(f"📝 Notas parciais geradas (mensagens {start}-{end})")
+        self._checkpoint = end
+
+    async def finalize(self) -> tuple:
+        """Cancela o trecho em andamento e retorna (notas, mensagens resumidas).
+
+        Não espera o resumo pendente: as mensagens que ele cobriria vão
+        literalmente na avaliação final.
+        """
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        return list(self.notes), self._checkpoint
+
+
+# ============================================================
+# FILA DE AVALIAÇÕES (SPOOL SQLITE)
+# ============================================================
+
+class EvaluationSpool:
+    """Spool persistente de avaliações em SQLite (modo WAL).
+
+    Compartilhado por todos os processos do worker: os jobs enfileiram, e
+    quem executa uma avaliação faz `claim` com lease. Se o processo morrer,
+    a lease expira e a avaliação volta a ficar disponível.
+
+    O resultado gerado fica na coluna `result` até a entrega: se a entrega
+    falhar, a nova tentativa só reenvia (sem gerar a avaliação de novo).
+    Status: pending, running, done, failed, undeliverable (sem destino).
+    """
+
+    def __init__(self, path: str = EVALUATION_SPOOL_PATH):
+        self.path = path
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._initialized:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        if not self._initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS evaluations (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    room_name TEXT NOT NULL,
+                    priority INTEGER NOT NULL DEFAULT 0,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL DEFAULT 0,
+                    lease_until REAL NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    result TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_evaluations_status ON evaluations (status, priority)")
+            # Spools criados antes da coluna `result`
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(evaluations)")}
+            if "result" not in columns:
+                conn.execute("ALTER TABLE evaluations ADD COLUMN result TEXT")
+            self._initialized = True
+        return conn
+
+    def enqueue(self, room_name: str, payload: dict, priority: int = 0) -> int:
+        now = time.time()
+        with closing(self._connect()) as conn:
+            cur = conn.execute(
+                "INSERT INTO evaluations (room_name, priority, payload, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (room_name, priority, json.dumps(payload), now, now),
+            )
+            return cur.lastrowid
+
+    def enqueue_and_claim(self, room_name: str, payload: dict, priority: int = 0,
+                          max_running: int = EVALUATION_MAX_CONCURRENCY,
+                          lease_seconds: float = EVALUATION_LEASE_SECONDS) -> dict:
+        """Enfileira já reservando para quem chamou, se houver vaga.
+
+        Insert e reserva na mesma transação: a fila do worker não consegue
+        pegar a avaliação entre um e outro. Retorna {"id", "claimed", "attempts"}.
+        """
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                running = conn.execute(
+                    "SELECT COUNT(*) FROM evaluations WHERE status = 'running' AND lease_until >= ?", (now,)
+                ).fetchone()[0]
+                claimed = running < max_running
+                if claimed:
+                    cur = conn.execute(
+                        "INSERT INTO evaluations (room_name, priority, payload, status, attempts, lease_until, "
+                        "created_at, updated_at) VALUES (?, ?, ?, 'running', 1, ?, ?, ?)",
+                        (room_name, priority, json.dumps(payload), now + lease_seconds, now, now),
+                    )
+                else:
+                    cur = conn.execute(
+                        "INSERT INTO evaluations (room_name, priority, payload, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                        (room_name, priority, json.dumps(payload), now, now),
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return {"id": cur.lastrowid, "claimed": claimed, "attempts": 1 if claimed else 0}
+
+    def claim(self, job_id: Optional[int] = None, max_running: int = EVALUATION_MAX_CONCURRENCY,
+              lease_seconds: float = EVALUATION_LEASE_SECONDS) -> Optional[dict]:
+        """Reserva uma avaliação (a de `job_id`, ou a de maior prioridade).
+
+        Respeita o limite de avaliações simultâneas do worker. Retorna None
+        se não houver vaga ou avaliação disponível.
+        """
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Leases expiradas que já esgotaram as tentativas não voltam para a fila
+                conn.execute(
+                    "UPDATE evaluations SET status = 'failed', last_error = 'lease expired', updated_at = ? "
+                    "WHERE status = 'running' AND lease_until < ? AND attempts >= ?",
+                    (now, now, EVALUATION_MAX_ATTEMPTS),
+                )
+                running = conn.execute(
+                    "SELECT COUNT(*) FROM evaluations WHERE status = 'running' AND lease_until >= ?", (now,)
+                ).fetchone()[0]
+                if running >= max_running:
+                    conn.execute("COMMIT")
+                    return None
+
+                available = (
+                    "((status = 'pending' AND next_attempt_at <= ?) OR (status = 'running' AND lease_until < ?))"
+                )
+                if job_id is not None:
+                    row = conn.execute(
+                        f"SELECT * FROM evaluations WHERE id = ? AND {available}", (job_id, now, now)
+                    ).fetchone()
+                else:
+                    row = conn.execute(
+                        f"SELECT * FROM evaluations WHERE {available} ORDER BY priority DESC, id ASC LIMIT 1",
+                        (now, now),
+                    ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+
+                conn.execute(
+                    "UPDATE evaluations SET status = 'running', attempts = attempts + 1, lease_until = ?, updated_at = ? WHERE id = ?",
+                    (now + lease_seconds, now, row["id"]),
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+        return {
+            "id": row["id"],
+            "room_name": row["room_name"],
+            "attempts": row["attempts"] + 1,
+            "payload": json.loads(row["payload"]),
+            "result": json.loads(row["result"]) if row["result"] else None,
+        }
+
+    def save_result(self, job_id: int, result: dict):
+        """Guarda a avaliação gerada (a entrega pode ser refeita sem gerar de novo)."""
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE evaluations SET result = ?, updated_at = ? WHERE id = ?",
+                (json.dumps(result), time.time(), job_id),
+            )
+
+    def complete(self, job_id: int):
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE evaluations SET status = 'done', payload = '{}', result = NULL, updated_at = ? WHERE id = ?",
+                (time.time(), job_id),
+            )
+
+    def mark_undeliverable(self, job_id: int, error: str):
+        """Avaliação gerada, mas sem destino: fica no spool com o resultado (não vira `done`)."""
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE evaluations SET status = 'undeliverable', last_error = ?, updated_at = ? WHERE id = ?",
+                (error, time.time(), job_id),
+            )
+
+    def fail(self, job_id: int, error: str, attempts: int, max_attempts: int = EVALUATION_MAX_ATTEMPTS) -> bool:
+        """Registra falha. Retorna True se a avaliação será tentada de novo."""
+        now = time.time()
+        retry = attempts < max_attempts
+        with closing(self._connect()) as conn:
+            if retry:
+                delay = 5 * (2 ** (attempts - 1))
+                conn.execute(
+                    "UPDATE evaluations SET status = 'pending', next_attempt_at = ?, last_error = ?, updated_at = ? WHERE id = ?",
+                    (now + delay, error, now, job_id),
+                )
+            else:
+                conn.execute(
+                    "UPDATE evaluations SET status = 'failed', last_error = ?, updated_at = ? WHERE id = ?",
+                    (error, now, job_id),
+                )
+        return retry
+
+    def count_active(self) -> int:
+        """Avaliações pendentes ou em execução (usado no cálculo de carga)."""
+        if not os.path.exists(self.path):
+            return 0
+        try:
+            with closing(self._connect()) as conn:
+                return conn.execute(
+                    "SELECT COUNT(*) FROM evaluations WHERE status IN ('pending', 'running')"
+                ).fetchone()[0]
+        except sqlite3.Error:
+            return 0
+
+    def purge(self, older_than_seconds: float = 86400) -> int:
+        """Remove avaliações concluídas/falhas/sem destino antigas."""
+        with closing(self._connect()) as conn:
+            cur = conn.execute(
+                "DELETE FROM evaluations WHERE status IN ('done', 'failed', 'undeliverable') AND updated_at < ?",
+                (time.time() - older_than_seconds,),
+            )
+            return cur.rowcount
+
+
+class UndeliverableEvaluation(Exception):
+    """Não há para onde entregar o resultado (room encerrada e sem webhook)."""
+
+
+class EvaluationQueue:
+    """Fila de avaliações com concorrência limitada, prioridade e retry.
+
+    - Nos jobs, `submit()` grava a avaliação no spool e, havendo vaga, a
+      executa na hora (com streaming para o frontend).
+    - No processo principal do worker, `run()` processa o que ficou na
+      fila (sem vaga, falhas, jobs que morreram) e entrega o resultado na
+      room pela API do LiveKit, ou no webhook se a room não existir mais.
+    """
+
+    def __init__(self, spool: "EvaluationSpool"):
+        self.spool = spool
+
+    async def submit(
+        self,
+        tm: TranscriptionManager,
+        config: dict,
+        recording_info: dict = None,
+        evaluator: Optional[IncrementalEvaluator] = None,
+        defer: bool = False,
+    ):
+        """Persiste a avaliação no spool e a processa aqui se houver vaga.
+
+        Com `defer` (sessão encerrando), só enfileira: a fila do worker avalia
+        e entrega pela room ou pelo webhook.
+        """
+        history = tm.get_history()
+        if len(history) < 2:
+            logger.warning(f"⚠️ Conversa muito curta ({len(history)} msgs)")
+            tm.send_error("Conversa muito curta para avaliação.")
+            return
+
+        notes, notes_until = await evaluator.finalize() if evaluator is not None else ([], 0)
+        payload = {
+            "room_name": tm.room_name,
+            "session_id": config.get("session_id"),
+            "customer_id": config.get("customer_id"),
+            "roleplay_id": config.get("roleplay_id"),
+            "user_id": config.get("user_id"),
+            "evaluation_prompt": config.get("evaluation_prompt", DEFAULT_CONFIG["evaluation_prompt"]),
+            "history": history,
+            "notes": notes,
+            "notes_until": notes_until,
+            "recording_info": recording_info,
+            "latency": tm.latency.summary(),
+            "transcript_key": tm.store_key,
+            "encoding": tm.publisher.encoding,  # entrega pela fila usa o formato negociado
+        }
+        # Usuário ainda na room = prioridade maior
+        priority = 1 if tm.room.remote_participants else 0
+
+        try:
+            if defer:
+                job_id = await asyncio.to_thread(self.spool.enqueue, tm.room_name, payload, priority)
+                tm.record("evaluation_queued", {"id": job_id})
+                logger.info(f"⏳ Avaliação enfileirada (id={job_id}) - será processada pela fila do worker")
+                return
+            job = await asyncio.to_thread(self.spool.enqueue_and_claim, tm.room_name, payload, priority)
+            job_id = job["id"]
+            tm.record("evaluation_queued", {"id": job_id})
+        except Exception as e:
+            # Spool indisponível: avaliar direto, sem persistência
+            logger.error(f"❌ Erro no spool de avaliações: {e}")
+            try:
+                evaluation = await generate_evaluation(payload, tm)
+                tm.record("evaluation", {"data": evaluation})
+                tm.send_evaluation(evaluation, recording_info, payload["latency"])
+            except Exception as e:
+                logger.error(f"❌ Erro na avaliação: {e}")
+                tm.send_error(str(e))
+            return
+
+        if not job["claimed"]:
+            logger.info(f"⏳ Avaliação enfileirada (id={job_id}) - limite de concorrência atingido")
+            tm._send_to_frontend("evaluation_queued", {"id": job_id})
+            return
+
+        try:
+            evaluation = await generate_evaluation(payload, tm)
+        except asyncio.CancelledError:
+            # Job encerrado no meio: a lease expira e a fila do worker assume
+            logger.warning(f"⚠️ Avaliação interrompida (id={job_id}) - será retomada pela fila")
+            raise
+        except Exception as e:
+            logger.error(f"❌ Erro na avaliação: {e}")
+            retry = await asyncio.to_thread(self.spool.fail, job_id, str(e), job["attempts"])
+            if retry:
+                tm._send_to_frontend("evaluation_queued", {"id": job_id, "retry": True})
+            else:
+                tm.send_error(str(e))
+            return
+
+        # Enviar avaliação COM informações da gravação
+        tm.record("evaluation", {"data": evaluation, "id": job_id})
+        tm.send_evaluation(evaluation, recording_info, payload["latency"])
+        await asyncio.to_thread(self.spool.complete, job_id)
+
+    async def run(self):
+        """Loop do processo principal: processa a fila até ser cancelado."""
+        logger.info(f"📬 Fila de avaliações ativa ({self.spool.path}, máx {EVALUATION_MAX_CONCURRENCY} simultâneas)")
+        running: set = set()
+        last_purge = 0.0
+        # A primeira recuperação acontece no start do worker (__main__)
+        last_recovery = time.monotonic()
+        while True:
+            try:
+                if time.monotonic() - last_purge > 3600:
+                    await asyncio.to_thread(self.spool.purge)
+                    last_purge = time.monotonic()
+
+                if TRANSCRIPT_STORE_ENABLED and time.monotonic() - last_recovery > TRANSCRIPT_STORE_RECOVERY_INTERVAL_SECONDS:
+                    last_recovery = time.monotonic()
+                    # Jobs que caíram com o worker no ar + limpeza por retenção do diário
+                    recovered = await asyncio.to_thread(
+                        _transcript_store.recover, self.spool, TRANSCRIPT_STORE_RECOVERY_IDLE_SECONDS
+                    )
+                    if recovered["recovered"] or recovered["purged"]:
+                        logger.info(f"♻️ Diário de transcrições: {recovered}")
+
+                job = await asyncio.to_thread(self.spool.claim)
+                if job is None:
+                    await asyncio.sleep(EVALUATION_QUEUE_POLL_SECONDS)
+                    continue
+
+                task = asyncio.create_task(self._process(job))
+                running.add(task)
+                task.add_done_callback(running.discard)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Erro na fila de avaliações: {e}")
+                await asyncio.sleep(EVALUATION_QUEUE_POLL_SECONDS)
+
+    async def _process(self, job: dict):
+        payload = job["payload"]
+        evaluation = job.get("result")
+        if evaluation is not None:
+            # Avaliação já gerada numa tentativa anterior: só falta entregar
+            logger.info(f"📬 Reenviando avaliação da fila (id={job['id']}, tentativa {job['attempts']})")
+        else:
+            logger.info(f"📬 Processando avaliação da fila (id={job['id']}, tentativa {job['attempts']})")
+            try:
+                evaluation = await generate_evaluation(payload)
+            except Exception as e:
+                logger.error(f"❌ Erro na avaliação (id={job['id']}): {e}")
+                retry = await asyncio.to_thread(self.spool.fail, job["id"], str(e), job["attempts"])
+                if not retry:
+                    try:
+                        await self._deliver(payload, {"type": "evaluation_error", "message": str(e)})
+                    except Exception as e:
+                        logger.error(f"❌ Erro ao entregar falha da avaliação (id={job['id']}): {e}")
+                return
+            await asyncio.to_thread(self.spool.save_result, job["id"], evaluation)
+
+            # Resultado fica no arquivo local mesmo que a entrega falhe
+            if payload.get("transcript_key"):
+                _transcript_store.append(payload["transcript_key"], "evaluation", {"data": evaluation, "id": job["id"]})
+
+        message = {"type": "evaluation", "data": evaluation}
+        if payload.get("recording_info"):
+            message["recording"] = payload["recording_info"]
+        if payload.get("latency"):
+            message["latency"] = payload["latency"]
+        try:
+            await self._deliver(payload, message)
+        except UndeliverableEvaluation as e:
+            logger.warning(f"⚠️ Avaliação de {payload['room_name']} sem destino (id={job['id']}): {e}")
+            await asyncio.to_thread(self.spool.mark_undeliverable, job["id"], str(e))
+            return
+        except Exception as e:
+            logger.error(f"❌ Erro ao entregar avaliação (id={job['id']}): {e}")
+            await asyncio.to_thread(self.spool.fail, job["id"], str(e), job["attempts"])
+            return
+        await asyncio.to_thread(self.spool.complete, job["id"])
+
+    async def _deliver(self, payload: dict, message: dict):
+        """Entrega o resultado na room (se ainda existir) ou no webhook."""
+        room_name = payload["room_name"]
+        # Mesmo codificador do publisher da sessão: formato negociado e chunks
+        # para avaliações maiores que o limite do pacote
+        encoder = DataChannelPublisher(None)
+        encoder.set_encoding(payload.get("encoding", "json"))
+        # Ids de chunk fora da faixa do publisher da sessão (que pode seguir ativo)
+        encoder._chunk_id = random.randrange(1 << 20, 1 << 30)
+        packets = encoder.encode_message(message)
+        try:
+            participants = await _livekit_api_pool.call(
+                "list_participants",
+                lambda lkapi: lkapi.room.list_participants(api.ListParticipantsRequest(room=room_name)),
+            )
+            if any(p.kind == api.ParticipantInfo.Kind.STANDARD for p in participants.participants):
+                for data in packets:
+                    await _livekit_api_pool.call(
+                        "send_data",
+                        lambda lkapi, data=data: lkapi.room.send_data(
+                            api.SendDataRequest(room=room_name, data=data, kind=api.DataPacket.Kind.RELIABLE)
+                        ),
+                    )
+                logger.info(f"📨 Avaliação entregue na room {room_name} ({len(packets)} pacote(s))")
+                return
+        except Exception as e:
+            logger.info(f"ℹ️ Room {room_name} indisponível para entrega: {e}")
 
-            if self._lkapi is None:
-                self._lkapi = api.LiveKitAPI()
+        if not EVALUATION_WEBHOOK_URL:
+            raise UndeliverableEvaluation("room encerrada e sem EVALUATION_WEBHOOK_URL")
 
-            # Parar o egress
-            stop_result = await self._lkapi.egress.stop_egress(
-                api.StopEgressRequest(egress_id=self.egress_id)
-            )
+        body = {k: payload.get(k) for k in ("room_name", "session_id", "customer_id", "roleplay_id", "user_id")}
+        body["message"] = message
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30)) as http:
+            async with http.post(EVALUATION_WEBHOOK_URL, json=body) as resp:
+                if resp.status >= 400:
+                    raise RuntimeError(f"webhook respondeu HTTP {resp.status}")
+        logger.info(f"📨 Avaliação de {room_name} entregue via webhook")
 
-            self.is_recording = False
 
-            # Montar URL do S3
-            s3_url = f"https://{AWS_BUCKET_NAME}.s3.{AWS_REGION}.amazonaws.com/{self.recording_filepath}"
+_evaluation_spool = EvaluationSpool()
+_evaluation_queue = EvaluationQueue(_evaluation_spool)
 
-            result["success"] = True
-            result["filepath"] = self.recording_filepath
-            result["s3_url"] = s3_url
 
-            logger.info(f"✅ Gravação finalizada!")
-            logger.info(f"   └─ S3 URL: {s3_url}")
-            logger.info(f"   └─ Status: {stop_result.status}")
+def _run_evaluation_queue():
+    """Thread do processo principal com o event loop próprio da fila."""
+    try:
+        asyncio.run(_evaluation_queue.run())
+    except Exception as e:
+        logger.error(f"❌ Fila de avaliações encerrada: {e}")
 
-        except Exception as e:
-            logger.error(f"❌ Erro ao parar gravação: {e}")
-            result["error"] = str(e)
 
-        finally:
-            # Fechar cliente API
-            if self._lkapi:
-                try:
-                    await self._lkapi.aclose()
-                except:
-                    pass
-                self._lkapi = None
+# ============================================================
+# ARQUIVO DE TRANSCRIÇÕES (SQLITE WAL, SÓ APPEND)
+# ============================================================
 
-        return result
+class TranscriptStore:
+    """Diário local das sessões: falas, eventos e avaliações (SQLite WAL).
+
+    Só recebe inserções: uma fala corrigida vira um novo registro com o
+    mesmo `index`, e o histórico é remontado pelo último registro de cada
+    índice. `append()` só coloca o registro numa fila em memória; a thread
+    de escrita grava em lotes, com um commit (fsync) por lote. Um crash
+    perde no máximo `TRANSCRIPT_STORE_FLUSH_MS` de registros.
+
+    Eventos (`kind`): session, message, started, recording,
+    evaluation_queued, evaluation, closed, recovered.
+    """
+
+    def __init__(self, path: str = TRANSCRIPT_STORE_PATH, flush_ms: int = TRANSCRIPT_STORE_FLUSH_MS):
+        self.path = path
+        self.flush_interval = flush_ms / 1000
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._initialized = False
+        self.metrics = {"records": 0, "batches": 0, "errors": 0}
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._initialized:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        if not self._initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS journal (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    session_key TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    data TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_journal_session ON journal (session_key, kind)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_journal_kind ON journal (kind, created_at)")
+            self._initialized = True
+        return conn
+
+    # ---------- Escrita (jobs e fila do worker) ----------
+
+    def open_session(self, room_name: str, config: dict) -> str:
+        """Abre o diário de uma sessão e retorna a chave dela."""
+        key = f"{room_name}-{uuid.uuid4().hex[:12]}"
+        data = {k: config.get(k) for k in ("session_id", "customer_id", "roleplay_id", "user_id", "evaluation_prompt")}
+        data["room_name"] = room_name
+        self.append(key, "session", data)
+        return key
+
+    def append(self, session_key: str, kind: str, data: dict = None):
+        """Enfileira um registro para a thread de escrita (não bloqueia)."""
+        if self._thread is None:
+            self._start()
+        self._queue.put((session_key, kind, json.dumps(data or {}, ensure_ascii=False), time.time()))
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Espera os registros já enfileirados chegarem ao disco."""
+        if self._thread is None:
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self):
+        if self._thread is not None:
+            self.flush()
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                # Criada no primeiro uso: cada processo (job) tem a sua
+                self._thread = threading.Thread(target=self._run, name="transcript-store", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _run(self):
+        conn = self._connect()
+        conn.execute("PRAGMA synchronous=FULL")  # commit = fsync (um por lote)
+        running = True
+        while running:
+            batch, waiters = [], []
+            item = self._queue.get()
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is None:
+                    running = False
+                    break
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                    break  # flush pedido: grava o lote agora
+                batch.append(item)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(conn, batch)
+            for waiter in waiters:
+                waiter.set()
+        conn.close()
 
-    def get_recording_info(self) -> dict:
-        """Retorna informações da gravação atual."""
+    def _write(self, conn: sqlite3.Connection, batch: list):
+        try:
+            conn.execute("BEGIN")
+            conn.executemany(
+                "INSERT INTO journal (session_key, kind, data, created_at) VALUES (?, ?, ?, ?)", batch
+            )
+            conn.execute("COMMIT")
+            self.metrics["records"] += len(batch)
+            self.metrics["batches"] += 1
+        except sqlite3.Error as e:
+            self.metrics["errors"] += 1
+            logger.error(f"❌ Erro ao gravar {len(batch)} registros de transcrição: {e}")
+            try:
+                conn.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
+
+    def stats(self) -> dict:
+        return dict(self.metrics)
+
+    # ---------- Leitura e recuperação ----------
+
+    def load(self, session_key: str, conn: Optional[sqlite3.Connection] = None) -> dict:
+        """Remonta uma sessão do diário: dados, histórico, eventos e avaliação."""
+        if conn is None:
+            with closing(self._connect()) as conn:
+                return self.load(session_key, conn)
+
+        session: dict = {}
+        messages: dict = {}
+        events: list = []
+        evaluation = None
+        rows = conn.execute(
+            "SELECT kind, data, created_at FROM journal WHERE session_key = ? ORDER BY id", (session_key,)
+        )
+        for row in rows:
+            data = json.loads(row["data"])
+            if row["kind"] == "session":
+                session = data
+            elif row["kind"] == "message":
+                messages[data["index"]] = {"role": data["role"], "content": data["content"]}
+            else:
+                events.append({"kind": row["kind"], "data": data, "at": row["created_at"]})
+                if row["kind"] == "evaluation":
+                    evaluation = data.get("data")
         return {
-            "egress_id": self.egress_id,
-            "filepath": self.recording_filepath,
-            "is_recording": self.is_recording,
-            "room_name": self.room_name,
-            "session_id": self.session_id,
+            "key": session_key,
+            "session": session,
+            "history": [messages[i] for i in sorted(messages)],
+            "events": events,
+            "evaluation": evaluation,
         }
 
+    def recover(self, spool: EvaluationSpool, idle_seconds: float = 0.0) -> dict:
+        """Reenfileira as avaliações de sessões interrompidas.
+
+        Sessão iniciada sem `evaluation_queued`/`evaluation` = o job morreu
+        antes de enfileirar a avaliação. O histórico gravado vai para o
+        spool e a fila do worker avalia e entrega (room ou webhook).
+
+        No start do worker (`idle_seconds=0`) nenhum job está rodando. Na
+        verificação periódica, os jobs estão em outros processos: sessão
+        sem `closed` com registro nos últimos `idle_seconds` ainda está ativa.
+        """
+        result = {"recovered": 0, "skipped": 0, "purged": 0, "active": 0}
+        with closing(self._connect()) as conn:
+            now = time.time()
+            cutoff = now - TRANSCRIPT_STORE_RETENTION_DAYS * 86400
+            result["purged"] = conn.execute(
+                "DELETE FROM journal WHERE session_key IN "
+                "(SELECT session_key FROM journal WHERE kind = 'session' AND created_at < ?)",
+                (cutoff,),
+            ).rowcount
+
+            keys = [row[0] for row in conn.execute("""
+                SELECT DISTINCT session_key FROM journal WHERE kind = 'started' AND session_key NOT IN (
+                    SELECT session_key FROM journal WHERE kind IN ('evaluation_queued', 'evaluation', 'recovered')
+                )
+            """)]
+            for key in keys:
+                if idle_seconds > 0:
+                    last_at, closed = conn.execute(
+                        "SELECT MAX(created_at), SUM(kind = 'closed') FROM journal WHERE session_key = ?", (key,)
+                    ).fetchone()
+                    if not closed and last_at is not None and last_at > now - idle_seconds:
+                        result["active"] += 1
+                        continue
+                saved = self.load(key, conn)
+                session, history = saved["session"], saved["history"]
+                if len(history) < 2:
+                    marker = {"skipped": "conversa muito curta"}
+                    result["skipped"] += 1
+                else:
+                    recording = [e["data"] for e in saved["events"] if e["kind"] == "recording"]
+                    payload = {
+                        "room_name": session.get("room_name", key),
+                        "session_id": session.get("session_id"),
+                        "customer_id": session.get("customer_id"),
+                        "roleplay_id": session.get("roleplay_id"),
+                        "user_id": session.get("user_id"),
+                        "evaluation_prompt": session.get("evaluation_prompt") or DEFAULT_CONFIG["evaluation_prompt"],
+                        "history": history,
+                        "notes": [],
+                        "recording_info": recording[-1] if recording else None,
+                        "latency": None,
+                        "transcript_key": key,
+                    }
+                    marker = {"evaluation_id": spool.enqueue(payload["room_name"], payload)}
+                    result["recovered"] += 1
+                    logger.info(
+                        f"♻️ Sessão {key} recuperada: {len(history)} mensagens → avaliação id={marker['evaluation_id']}"
+                    )
+                conn.execute(
+                    "INSERT INTO journal (session_key, kind, data, created_at) VALUES (?, 'recovered', ?, ?)",
+                    (key, json.dumps(marker), time.time()),
+                )
+        return result
+
+
+_transcript_store = TranscriptStore()
+
 
 # ============================================================
-# CLASSE GERENCIADORA DE TRANSCRIÇÃO
+# PROMPT DA SESSÃO (PREFIXO ESTÁVEL + CACHE DO PROVEDOR)
 # ============================================================
+#
+# A OpenAI reaproveita (cache) o processamento do início do prompt quando ele
+# é idêntico ao de uma chamada recente (só prefixos com 1024+ tokens): menos
+# tempo até o primeiro áudio e tokens de entrada mais baratos. As instruções
+# da sessão são a persona do roleplay seguida do protocolo de encerramento,
+# iguais em todas as sessões do mesmo roleplay; dentro de uma sessão, cada
+# resposta repete esse prefixo. Conteúdo que muda por sessão ou por resposta
+# vai sempre no sufixo: o texto passado a `generate_reply(instructions=...)`,
+# que o plugin da OpenAI já anexa às instruções da sessão (não repetir o
+# prefixo aqui).
+
+_END_CALL_INSTRUCTION = """
 
-class TranscriptionManager:
-    """Gerencia transcrições de forma centralizada."""
+IMPORTANTE: Quando a conversa chegar a uma conclusão natural (acordo fechado, 
+recusa definitiva, despedida do vendedor, ou quando você não tiver mais interesse), 
+você DEVE encerrar a ligação de forma educada e natural, dizendo algo como 
+"Ok, obrigado pelo contato. Tchau!" ou "Certo, vou pensar. Até mais!".
+Após sua despedida, envie EXATAMENTE a palavra-chave [ENCERRAR_LIGACAO] sozinha."""
 
-    def __init__(self, room: rtc.Room, room_name: str):
-        self.room = room
-        self.room_name = room_name
-        self.history: list = []
-        self._last_ai_text: str = ""
-        self._last_user_text: str = ""
-        self._ai_buffer: str = ""
-        self._ai_buffer_timer: Optional[asyncio.Task] = None
-        self._greeting_sent: bool = False
 
-    def add_user_message(self, text: str) -> bool:
-        """Adiciona mensagem do usuário."""
-        if not text or len(text.strip()) < 2:
-            return False
-        text = text.strip()
-        if text == self._last_user_text:
+def build_system_prompt(persona_prompt: str) -> str:
+    """Instruções da sessão: persona + protocolo de encerramento.
+
+    Persona que já traz o próprio protocolo ([ENCERRAR_LIGACAO]) não recebe
+    o padrão.
+    """
+    if "[ENCERRAR_LIGACAO]" not in persona_prompt:
+        return persona_prompt + _END_CALL_INSTRUCTION
+    return persona_prompt
+
+
+class PromptCacheStats:
+    """Tokens de entrada da Realtime API e quanto deles veio do cache."""
+
+    def __init__(self):
+        self.responses = 0
+        self.cached_responses = 0
+        self.input_tokens = 0
+        self.cached_tokens = 0
+        self.output_tokens = 0
+        self._ttft = {"hit": LatencyStats(), "miss": LatencyStats()}
+
+    def add(self, input_tokens: int, cached_tokens: int, output_tokens: int, ttft_s: float):
+        self.responses += 1
+        self.input_tokens += input_tokens
+        self.cached_tokens += cached_tokens
+        self.output_tokens += output_tokens
+        cache = "hit" if cached_tokens > 0 else "miss"
+        if cached_tokens > 0:
+            self.cached_responses += 1
+        if ttft_s >= 0:
+            self._ttft[cache].record("ttft", ttft_s * 1000)
+
+    def summary(self) -> dict:
+        return {
+            "responses": self.responses,
+            "input_tokens": self.input_tokens,
+            "cached_tokens": self.cached_tokens,
+            "output_tokens": self.output_tokens,
+            "hit_rate": round(self.cached_tokens / self.input_tokens, 3) if self.input_tokens else 0.0,
+            "cached_responses": self.cached_responses,
+            "ttft_hit": self._ttft["hit"].summary().get("ttft"),
+            "ttft_miss": self._ttft["miss"].summary().get("ttft"),
+        }
+
+
+class PromptCacheTracker:
+    """Lê o evento `metrics_collected` da sessão (RealtimeModelMetrics)."""
+
+    def __init__(self):
+        self.stats = PromptCacheStats()
+
+    def on_metrics(self, metrics) -> bool:
+        """Contabiliza uma resposta do modelo Realtime. Ignora outras métricas."""
+        if getattr(metrics, "type", None) != "realtime_model_metrics":
             return False
-        self._last_user_text = text
-        logger.info(f"👤 USUÁRIO: {text}")
-        self.history.append({"role": "user", "content": text})
-        self._send_to_frontend("transcription", {"role": "user", "text": text})
+        details = getattr(metrics, "input_token_details", None)
+        input_tokens = getattr(metrics, "input_tokens", 0) or 0
+        cached_tokens = getattr(details, "cached_tokens", 0) or 0
+        output_tokens = getattr(metrics, "output_tokens", 0) or 0
+        ttft = getattr(metrics, "ttft", -1)
+        ttft = -1 if ttft is None else ttft
+
+        self.stats.add(input_tokens, cached_tokens, output_tokens, ttft)
+        METRIC_REALTIME_TOKENS.labels(kind="input").inc(input_tokens)
+        METRIC_REALTIME_TOKENS.labels(kind="cached_input").inc(cached_tokens)
+        METRIC_REALTIME_TOKENS.labels(kind="output").inc(output_tokens)
+        if ttft >= 0:
+            METRIC_REALTIME_TTFT.labels(cache="hit" if cached_tokens else "miss").observe(ttft)
         return True
 
-    def add_ai_message(self, text: str) -> bool:
-        """Adiciona mensagem da IA com buffer para evitar fragmentação."""
-        if not text or len(text.strip()) < 2:
-            return False
-        text = text.strip()
-        
-        if "[ENCERRAR_LIGACAO]" in text:
-            if self._ai_buffer:
-                self._flush_ai_buffer()
-            display_text = text.replace("[ENCERRAR_LIGACAO]", "").strip()
-            if display_text:
-                self._process_ai_message(display_text)
-            return True
-        
-        if text == self._last_ai_text:
-            return False
-            
-        if self._last_ai_text and text in self._last_ai_text:
-            return False
-            
-        if self._last_ai_text and self._last_ai_text in text:
-            logger.debug(f"📝 Substituindo fragmento por versão completa")
-            self._last_ai_text = text
-            if self.history and self.history[-1]["role"] == "assistant":
-                self.history[-1]["content"] = text
-                self._send_to_frontend("transcription", {"role": "ai", "text": text, "replace": True})
-            return False
-            
-        return self._process_ai_message(text)
-    
-    def _process_ai_message(self, text: str) -> bool:
-        """Processa e adiciona mensagem da IA."""
-        if text == self._last_ai_text:
-            return False
-        self._last_ai_text = text
-        logger.info(f"🤖 IA: {text}")
-        self.history.append({"role": "assistant", "content": text})
-        self._send_to_frontend("transcription", {"role": "ai", "text": text})
-        return False
-    
-    def _flush_ai_buffer(self):
-        """Envia o buffer acumulado."""
-        if self._ai_buffer:
-            self._process_ai_message(self._ai_buffer)
-            self._ai_buffer = ""
+    def summary(self) -> dict:
+        return self.stats.summary()
 
-    def check_for_end_signal(self, text: str) -> bool:
-        """Verifica se o texto contém sinal de encerramento."""
-        return "[ENCERRAR_LIGACAO]" in text
 
-    def _send_to_frontend(self, msg_type: str, data: dict = None):
-        """Envia mensagem para o frontend via DataChannel."""
-        try:
-            message = {"type": msg_type}
-            if data:
-                message.update(data)
-            payload = json.dumps(message).encode("utf-8")
-            asyncio.create_task(
-                self.room.local_participant.publish_data(payload, reliable=True)
-            )
-        except Exception as e:
-            logger.error(f"❌ Erro ao enviar para frontend: {e}")
+# ============================================================
+# CONFIGURAÇÃO DO ROLEPLAY (VALIDAÇÃO + COMPILAÇÃO)
+# ============================================================
 
-    def send_status(self, status: str):
-        self._send_to_frontend(status)
+# Campos da metadata: caminho → tipos aceitos (ausente = padrão)
+_METADATA_SCHEMA = {
+    ("persona",): (dict,),
+    ("persona", "name"): (str,),
+    ("persona", "company"): (str,),
+    ("voice",): (dict,),
+    ("voice", "name"): (str,),
+    ("prompts",): (dict,),
+    ("prompts", "system"): (str,),
+    ("prompts", "greeting"): (str,),
+    ("prompts", "evaluation"): (str,),
+    ("criteria",): (list,),
+    ("config",): (dict,),
+    ("config", "time_limit"): (int, float),
+    ("config", "streaming_captions"): (bool,),
+    ("session_id",): (str, int),
+    ("roleplay_id",): (str, int),
+    ("customer_id",): (str, int),
+    ("user_id",): (str, int),
+}
 
-    def send_error(self, message: str):
-        self._send_to_frontend("evaluation_error", {"message": message})
 
-    def send_evaluation(self, evaluation: dict, recording_info: dict = None):
-        """Envia avaliação com informações da gravação."""
-        data = {"data": evaluation}
-        if recording_info:
-            data["recording"] = recording_info
-        self._send_to_frontend("evaluation", data)
-    
-    def send_auto_end(self, recording_info: dict = None):
-        """Notifica o frontend que a IA encerrou a ligação."""
-        logger.info("📞 IA solicitou encerramento da ligação")
-        data = {"reason": "ai_ended"}
-        if recording_info:
-            data["recording"] = recording_info
-        self._send_to_frontend("auto_end_simulation", data)
+def validate_metadata(data) -> list:
+    """Valida a metadata do PHP e retorna a lista de erros (vazia = válida).
+
+    Campo inválido é removido de `data` (a sessão usa o padrão daquele
+    campo) e o erro é reportado ao frontend como `config_error`.
+    """
+    if not isinstance(data, dict):
+        return [f"metadata deve ser um objeto JSON (recebido: {type(data).__name__})"]
+
+    errors = []
+    for path, types in _METADATA_SCHEMA.items():
+        parent = data
+        for key in path[:-1]:
+            parent = parent.get(key) if isinstance(parent, dict) else None
+        if not isinstance(parent, dict) or parent.get(path[-1]) is None:
+            continue
+        value = parent[path[-1]]
+        error = None
+        # bool é int em Python: não vale como número
+        if not isinstance(value, types) or (isinstance(value, bool) and bool not in types):
+            error = f"esperado {'/'.join(t.__name__ for t in types)}, recebido {value!r:.40}"
+        elif isinstance(value, str) and path[0] == "prompts" and not value.strip():
+            error = "texto vazio"
+        elif path == ("config", "time_limit") and value < 0:
+            error = f"não pode ser negativo ({value})"
+        if error:
+            errors.append(f"{'.'.join(path)}: {error}")
+            del parent[path[-1]]
+    return errors
+
+
+class RoleplayConfig:
+    """Parte da configuração que vem do roleplay (persona, voz, prompts, critérios).
+
+    Compilada por sessão a partir da metadata já validada: montar o prompt e
+    mapear a voz custa menos que qualquer cache (cada job é um processo novo).
+    """
+
+    __slots__ = (
+        "roleplay_id", "system_prompt", "greeting", "evaluation_prompt",
+        "voice", "voice_raw", "criteria", "persona_name", "persona_company",
+    )
 
-    def send_recording_ready(self, recording_info: dict):
-        """Envia dados da gravação para o frontend."""
-        logger.info(f"📼 Enviando dados de gravação: {recording_info.get('s3_url', 'N/A')}")
-        self._send_to_frontend("recording_ready", recording_info)
+    @classmethod
+    def compile(cls, data: dict) -> "RoleplayConfig":
+        persona = data.get("persona") or {}
+        prompts = data.get("prompts") or {}
+        voice_raw = (data.get("voice") or {}).get("name", "neutral")
+        return cls(
+            roleplay_id=data.get("roleplay_id"),
+            system_prompt=build_system_prompt(prompts.get("system", DEFAULT_CONFIG["system_prompt"])),
+            greeting=prompts.get("greeting", DEFAULT_CONFIG["greeting"]),
+            evaluation_prompt=prompts.get("evaluation", DEFAULT_CONFIG["evaluation_prompt"]),
+            voice=map_voice_to_realtime(voice_raw),
+            voice_raw=voice_raw,
+            criteria=data.get("criteria") or (),
+            persona_name=persona.get("name", "Cliente"),
+            persona_company=persona.get("company", "N/A"),
+        )
 
-    def get_history(self) -> list:
-        return self.history.copy()
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields[name])
+        self.criteria = tuple(self.criteria)
+
+    def session_config(self, data: dict) -> dict:
+        """Config da sessão: partes compiladas + campos próprios desta sessão."""
+        options = data.get("config") or {}
+        return {
+            "system_prompt": self.system_prompt,
+            "greeting": self.greeting,
+            "evaluation_prompt": self.evaluation_prompt,
+            "voice": self.voice,
+            "time_limit": options.get("time_limit", 30),
+            "criteria": self.criteria,
+            "persona_name": self.persona_name,
+            "session_id": data.get("session_id", "unknown"),
+            "roleplay_id": data.get("roleplay_id"),
+            "customer_id": data.get("customer_id"),
+            "user_id": data.get("user_id"),
+            "streaming_captions": bool(options.get("streaming_captions", False)),
+        }
 
 
 # ============================================================
@@ -426,117 +3207,258 @@ def map_voice_to_realtime(voice: str) -> str:
     return mapped
 
 
+def _time_limit_seconds(config: dict) -> float:
+    """Converte `time_limit` (minutos) em segundos; 0 = sem limite."""
+    try:
+        return max(0.0, float(config.get("time_limit") or 0) * 60)
+    except (TypeError, ValueError):
+        logger.warning(f"⚠️ time_limit inválido: {config.get('time_limit')!r} - sem limite de tempo")
+        return 0.0
+
+
+def _fallback_config(base: dict, errors: list) -> dict:
+    """Configuração padrão (metadata ausente ou inválida), com o mesmo layout de prompt."""
+    config = dict(base)
+    config["system_prompt"] = build_system_prompt(base.get("system_prompt") or DEFAULT_CONFIG["system_prompt"])
+    config["config_errors"] = errors
+    return config
+
+
 def parse_metadata(metadata_str: str) -> dict:
-    """Parse do metadata JSON enviado pelo PHP."""
+    """Parse do metadata JSON enviado pelo PHP.
+
+    Persona, voz, prompts e critérios são compilados em `RoleplayConfig`.
+    Erros de validação ficam em `config["config_errors"]` (o entrypoint
+    repassa ao frontend); os campos inválidos usam o valor padrão.
+    """
     if not metadata_str:
         logger.warning("⚠️ Metadata vazio - usando configuração padrão")
-        return DEFAULT_CONFIG.copy()
+        return _fallback_config(DEFAULT_CONFIG, ["metadata vazio"])
 
     try:
         data = json.loads(metadata_str)
+    except ValueError as e:
+        logger.error(f"❌ Metadata não é JSON válido: {e}")
+        return _fallback_config(DEFAULT_CONFIG, [f"metadata não é JSON válido: {e}"])
+
+    errors = validate_metadata(data)
+    if not isinstance(data, dict):
+        logger.error(f"❌ Metadata inválido: {errors[0]}")
+        return _fallback_config(DEFAULT_CONFIG, errors)
+
+    compiled = RoleplayConfig.compile(data)
+    config = compiled.session_config(data)
+    config["config_errors"] = errors
+
+    logger.info("📋 Configuração carregada:")
+    logger.info(f"   └─ Persona: {compiled.persona_name} @ {compiled.persona_company}")
+    logger.info(f"   └─ Voz: {compiled.voice} (original: {compiled.voice_raw})")
+    logger.info(f"   └─ Prompt: {len(config['system_prompt'])} chars")
+    logger.info(f"   └─ Session ID: {config['session_id']}")
+    for error in errors:
+        logger.warning(f"⚠️ Metadata inválido: {error} - usando o padrão")
+
+    return config
+
+
+def get_openai_client() -> openai_client.AsyncOpenAI:
+    """Retorna o cliente OpenAI do processo (criado uma única vez e reutilizado)."""
+    return _openai_pool.get()
+
+
+def _format_conversation(history: list) -> str:
+    """Formata o histórico no texto usado pelos prompts de avaliação."""
+    lines = []
+    for msg in history:
+        role = "PARTICIPANTE" if msg["role"] == "user" else "INTERLOCUTOR"
+        lines.append(f"{role}: {msg['content']}\n")
+    return "".join(lines)
+
+
+async def _stream_evaluation(client: openai_client.AsyncOpenAI, eval_prompt: str, tm: TranscriptionManager) -> str:
+    """Gera a avaliação em streaming, repassando trechos ao frontend."""
+    stream = await client.chat.completions.create(
+        model=EVALUATION_MODEL,
+        messages=[{"role": "user", "content": eval_prompt}],
+        temperature=0.3,
+        max_tokens=2000,
+        stream=True,
+        stream_options={"include_usage": True},
+    )
 
-        persona = data.get('persona', {})
-        persona_name = persona.get('name', 'Cliente') if isinstance(persona, dict) else 'Cliente'
-        persona_company = persona.get('company', 'N/A') if isinstance(persona, dict) else 'N/A'
+    parts = []
+    pending = []
+    seq = 0
+    interval = EVALUATION_STREAM_INTERVAL_MS / 1000
+    last_sent = time.monotonic()
+    async for chunk in stream:
+        _record_token_usage(EVALUATION_MODEL, chunk.usage)  # só o último chunk traz usage
+        delta = chunk.choices[0].delta.content if chunk.choices else None
+        if not delta:
+            continue
+        parts.append(delta)
+        pending.append(delta)
+        # Agrupar deltas para não enviar um pacote por token
+        if time.monotonic() - last_sent >= interval:
+            tm._send_to_frontend("evaluation_partial", {"seq": seq, "delta": "".join(pending)})
+            seq += 1
+            pending = []
+            last_sent = time.monotonic()
+    if pending:
+        tm._send_to_frontend("evaluation_partial", {"seq": seq, "delta": "".join(pending)})
+
+    return "".join(parts)
+
+
+def _parse_evaluation_json(result: str) -> dict:
+    """Extrai o JSON da resposta (remove cercas de markdown)."""
+    json_str = result.strip()
+    if json_str.startswith("```"):
+        lines = json_str.split("\n")
+        if lines[0].startswith("```"):
+            lines = lines[1:]
+        if lines and lines[-1].strip() == "```":
+            lines = lines[:-1]
+        json_str = "\n".join(lines)
+    return json.loads(json_str)
+
+
+def build_evaluation_prompt(job: dict) -> str:
+    """Monta o prompt da avaliação: notas parciais + conversa formatada.
+
+    As notas substituem as primeiras `notes_until` mensagens (já resumidas
+    durante a ligação); só o restante vai literal. Tudo entra no lugar de
+    {{CONVERSATION}}, antes das instruções de formato do prompt.
+    """
+    history = job["history"]
+    notes = job.get("notes") or []
+    summarized = min(job.get("notes_until") or 0, len(history)) if notes else 0
+    conversation_text = _format_conversation(history[summarized:])
+
+    if notes:
+        if summarized:
+            header = f"NOTAS PARCIAIS (resumo das primeiras {summarized} mensagens):"
+            conversation_text = f"RESTANTE DA CONVERSA:\n{conversation_text}"
+        else:
+            header = "NOTAS PARCIAIS (levantadas durante a conversa):"
+        conversation_text = header + "\n" + "\n\n".join(notes) + "\n\n" + conversation_text
 
-        voice_config = data.get('voice', {})
-        voice_raw = voice_config.get('name', 'neutral') if isinstance(voice_config, dict) else 'neutral'
-        voice = map_voice_to_realtime(voice_raw)
+    eval_prompt = job.get("evaluation_prompt") or DEFAULT_CONFIG["evaluation_prompt"]
+    return eval_prompt.replace("{{CONVERSATION}}", conversation_text)
 
-        prompts = data.get('prompts', {})
-        
-        system_prompt = prompts.get('system', DEFAULT_CONFIG["system_prompt"])
-        end_instruction = """
 
-IMPORTANTE: Quando a conversa chegar a uma conclusão natural (acordo fechado, 
-recusa definitiva, despedida do vendedor, ou quando você não tiver mais interesse), 
-você DEVE encerrar a ligação de forma educada e natural, dizendo algo como 
-"Ok, obrigado pelo contato. Tchau!" ou "Certo, vou pensar. Até mais!".
-Após sua despedida, envie EXATAMENTE a palavra-chave [ENCERRAR_LIGACAO] sozinha."""
-        
-        if "[ENCERRAR_LIGACAO]" not in system_prompt:
-            system_prompt += end_instruction
-
-        config = {
-            "system_prompt": system_prompt,
-            "greeting": prompts.get('greeting', DEFAULT_CONFIG["greeting"]),
-            "evaluation_prompt": prompts.get('evaluation', DEFAULT_CONFIG["evaluation_prompt"]),
-            "voice": voice,
-            "time_limit": data.get('config', {}).get('time_limit', 30),
-            "criteria": data.get('criteria', []),
-            "persona_name": persona_name,
-            "session_id": data.get('session_id', 'unknown'),
-            "roleplay_id": data.get('roleplay_id'),
-            "customer_id": data.get('customer_id'),
-            "user_id": data.get('user_id'),
-        }
+async def generate_evaluation(job: dict, tm: Optional[TranscriptionManager] = None) -> dict:
+    """Gera avaliação da conversa usando GPT-4.
 
-        logger.info(f"📋 Configuração carregada:")
-        logger.info(f"   └─ Persona: {persona_name} @ {persona_company}")
-        logger.info(f"   └─ Voz: {voice} (original: {voice_raw})")
-        logger.info(f"   └─ Prompt: {len(config['system_prompt'])} chars")
-        logger.info(f"   └─ Session ID: {config['session_id']}")
+    `job` é o payload da fila de avaliações (histórico, prompt, notas).
+    Com `tm`, a resposta é enviada em streaming ao frontend.
+    """
+    logger.info(f"📊 Gerando avaliação para {len(job['history'])} mensagens...")
 
-        return config
+    eval_prompt = build_evaluation_prompt(job)
 
-    except Exception as e:
-        logger.error(f"❌ Erro ao processar metadata: {e}")
-        return DEFAULT_CONFIG.copy()
+    client = get_openai_client()
+    t0 = time.perf_counter()
 
+    if EVALUATION_STREAMING and tm is not None:
+        result = await _stream_evaluation(client, eval_prompt, tm)
+    else:
+        response = await client.chat.completions.create(
+            model=EVALUATION_MODEL,
+            messages=[{"role": "user", "content": eval_prompt}],
+            temperature=0.3,
+            max_tokens=2000
+        )
+        _record_token_usage(EVALUATION_MODEL, response.usage)
+        result = response.choices[0].message.content
 
-async def generate_evaluation(tm: TranscriptionManager, config: dict, recording_info: dict = None):
-    """Gera avaliação da conversa usando GPT-4."""
-    try:
-        history = tm.get_history()
+    elapsed = time.perf_counter() - t0
+    METRIC_EVALUATION_LATENCY.labels(model=EVALUATION_MODEL).observe(elapsed)
+    logger.info(f"   └─ Resposta em {elapsed * 1000:.0f}ms - pool: {_openai_pool.stats()}")
 
-        if len(history) < 2:
-            logger.warning(f"⚠️ Conversa muito curta ({len(history)} msgs)")
-            tm.send_error("Conversa muito curta para avaliação.")
-            return
+    evaluation = _parse_evaluation_json(result)
 
-        logger.info(f"📊 Gerando avaliação para {len(history)} mensagens...")
+    logger.info(f"✅ Avaliação concluída: Score = {evaluation.get('overall_score', 'N/A')}")
+    return evaluation
 
-        conversation_text = ""
-        for msg in history:
-            role = "PARTICIPANTE" if msg["role"] == "user" else "INTERLOCUTOR"
-            conversation_text += f"{role}: {msg['content']}\n"
 
-        eval_prompt = config.get("evaluation_prompt", DEFAULT_CONFIG["evaluation_prompt"])
-        eval_prompt = eval_prompt.replace("{{CONVERSATION}}", conversation_text)
+async def wait_for_metadata(room: rtc.Room, timeout: float = METADATA_TIMEOUT_SECONDS) -> Optional[str]:
+    """Aguarda a metadata da room ou de um participante, orientado a eventos.
 
-        import openai as openai_client
-        client = openai_client.AsyncOpenAI()
+    Resolve assim que `room_metadata_changed`, `participant_connected` ou
+    `participant_metadata_changed` trouxer metadata. Retorna None no timeout.
+    """
+    if room.metadata:
+        return room.metadata
+    for p in room.remote_participants.values():
+        if p.metadata:
+            return p.metadata
 
-        response = await client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "user", "content": eval_prompt}],
-            temperature=0.3,
-            max_tokens=2000
-        )
+    logger.info("🔍 Aguardando metadata do participante...")
+    future: asyncio.Future = asyncio.get_running_loop().create_future()
 
-        result = response.choices[0].message.content
+    def resolve(metadata: str):
+        if metadata and not future.done():
+            future.set_result(metadata)
 
-        json_str = result.strip()
-        if json_str.startswith("```"):
-            lines = json_str.split("\n")
-            if lines[0].startswith("```"):
-                lines = lines[1:]
-            if lines and lines[-1].strip() == "```":
-                lines = lines[:-1]
-            json_str = "\n".join(lines)
+    def on_room_metadata_changed(old_metadata: str, new_metadata: str):
+        resolve(new_metadata)
 
-        evaluation = json.loads(json_str)
+    def on_participant_connected(participant: rtc.RemoteParticipant):
+        resolve(participant.metadata)
 
-        logger.info(f"✅ Avaliação concluída: Score = {evaluation.get('overall_score', 'N/A')}")
-        
-        # Enviar avaliação COM informações da gravação
-        tm.send_evaluation(evaluation, recording_info)
+    def on_participant_metadata_changed(participant: rtc.Participant, old_metadata: str, new_metadata: str):
+        resolve(new_metadata)
 
-    except Exception as e:
-        logger.error(f"❌ Erro na avaliação: {e}")
-        import traceback
-        traceback.print_exc()
-        tm.send_error(str(e))
+    room.on("room_metadata_changed", on_room_metadata_changed)
+    room.on("participant_connected", on_participant_connected)
+    room.on("participant_metadata_changed", on_participant_metadata_changed)
+    try:
+        return await asyncio.wait_for(future, timeout)
+    except asyncio.TimeoutError:
+        logger.warning(f"⚠️ Metadata não recebida em {timeout:.0f}s")
+        return None
+    finally:
+        room.off("room_metadata_changed", on_room_metadata_changed)
+        room.off("participant_connected", on_participant_connected)
+        room.off("participant_metadata_changed", on_participant_metadata_changed)
+
+
+# ============================================================
+# PREWARM DO PROCESSO (ANTES DO PRIMEIRO JOB)
+# ============================================================
+
+def prewarm(proc: JobProcess):
+    """Carrega modelos e clientes compartilhados antes do primeiro job.
+
+    Executado uma vez por processo de job pelo LiveKit, fora do caminho
+    crítico da chamada. Tudo fica em `proc.userdata` para o entrypoint.
+    """
+    timings = {}
+    t_start = time.perf_counter()
+
+    # Cliente OpenAI com pool HTTP reutilizável
+    t0 = time.perf_counter()
+    proc.userdata["openai_client"] = get_openai_client()
+    timings["openai_client"] = time.perf_counter() - t0
+
+    # Configuração padrão pronta para uso
+    t0 = time.perf_counter()
+    proc.userdata["default_config"] = DEFAULT_CONFIG.copy()
+    timings["config"] = time.perf_counter() - t0
+
+    # Saudação padrão do cache de disco para a memória
+    if GREETING_CACHE_ENABLED:
+        t0 = time.perf_counter()
+        _greeting_cache.preload(DEFAULT_CONFIG["greeting"], DEFAULT_CONFIG["voice"])
+        timings["greeting_cache"] = time.perf_counter() - t0
+
+    total = time.perf_counter() - t_start
+    proc.userdata["prewarm_timings"] = timings
+
+    logger.info(f"🔥 Prewarm concluído em {total * 1000:.0f}ms")
+    for step, elapsed in timings.items():
+        logger.info(f"   └─ {step}: {elapsed * 1000:.0f}ms")
 
 
 # ============================================================
@@ -546,9 +3468,11 @@ async def generate_evaluation(tm: TranscriptionManager, config: dict, recording_
 async def entrypoint(ctx: JobContext):
     """Ponto de entrada do Agent LiveKit com Realtime API + Gravação + BVC."""
     room_name = ctx.room.name
-    logger.info(f"{'='*60}")
+    t_job_start = time.perf_counter()
+    _log_context.set({"room": room_name, "session_id": None, "customer_id": None})
+    log_separator()
     logger.info(f"🚀 ROLEPLAY AGENT v5.4 REALTIME + RECORDING + BVC - Room: {room_name}")
-    logger.info(f"{'='*60}")
+    log_separator()
 
     # ========================================
     # 1. CONECTAR IMEDIATAMENTE
@@ -558,55 +3482,20 @@ async def entrypoint(ctx: JobContext):
     logger.info("✅ Conectado!")
 
     # ========================================
-    # 2. CARREGAR CONFIGURAÇÃO
+    # 2. AGUARDAR METADATA (EM PARALELO)
     # ========================================
-    config = DEFAULT_CONFIG.copy()
-
-    if ctx.room.metadata:
-        config = parse_metadata(ctx.room.metadata)
-    else:
-        logger.info("🔍 Aguardando metadata do participante...")
-        for i in range(10):
-            for p in ctx.room.remote_participants.values():
-                if p.metadata:
-                    config = parse_metadata(p.metadata)
-                    break
-            else:
-                await asyncio.sleep(1)
-                continue
-            break
-        else:
-            logger.warning("⚠️ Usando configuração padrão")
+    # A metadata chega por evento; enquanto isso o modelo Realtime e a
+    # sessão (que não dependem da configuração) já são construídos.
+    metadata_task = asyncio.create_task(wait_for_metadata(ctx.room))
 
-    # ========================================
-    # 3. INICIALIZAR COMPONENTES
-    # ========================================
     tm = TranscriptionManager(ctx.room, room_name)
-    
-    # Inicializar gerenciador de gravação
-    rm = RecordingManager(
-        room_name=room_name,
-        session_id=config.get("session_id", "unknown"),
-        customer_id=str(config.get("customer_id", "unknown"))
-    )
-    
-    _sessions[room_name] = {
-        "config": config, 
-        "tm": tm,
-        "rm": rm,  # Recording Manager
-        "started": False,
-        "ending": False
-    }
 
-    voice = config.get("voice", "ash")
-    
     # ========================================
-    # 4. CRIAR MODELO REALTIME
+    # 3. CRIAR MODELO REALTIME
     # ========================================
-    logger.info(f"🎙️ Inicializando OpenAI Realtime API com voz: {voice}")
-    
+    default_config = ctx.proc.userdata.get("default_config", DEFAULT_CONFIG)
     realtime_model = openai.realtime.RealtimeModel(
-        voice=voice,
+        voice=default_config.get("voice", "ash"),
         temperature=0.8,
         modalities=["text", "audio"],
         turn_detection=TurnDetection(
@@ -620,12 +3509,190 @@ async def entrypoint(ctx: JobContext):
     )
 
     # ========================================
-    # 5. CRIAR SESSÃO DO AGENT
+    # 4. CRIAR SESSÃO DO AGENT
     # ========================================
     session = AgentSession(
         llm=realtime_model,
     )
 
+    # ========================================
+    # 5. CARREGAR CONFIGURAÇÃO
+    # ========================================
+    metadata = await metadata_task
+    if metadata:
+        config = parse_metadata(metadata)
+    else:
+        logger.warning("⚠️ Usando configuração padrão")
+        config = _fallback_config(default_config, [f"metadata não recebida em {METADATA_TIMEOUT_SECONDS:.0f}s"])
+
+    # Metadata inválida: o frontend fica sabendo (a sessão segue com os padrões)
+    if config.get("config_errors"):
+        tm._send_to_frontend("config_error", {"errors": config["config_errors"]})
+
+    # Contexto dos logs (o dict é compartilhado com as tasks já criadas)
+    log_context = _log_context.get()
+    log_context["session_id"] = config.get("session_id")
+    log_context["customer_id"] = config.get("customer_id")
+
+    voice = config.get("voice", "ash")
+    logger.info(f"🎙️ Inicializando OpenAI Realtime API com voz: {voice}")
+    if voice != default_config.get("voice", "ash"):
+        # Nenhuma sessão Realtime foi aberta ainda, então a troca é imediata
+        realtime_model.update_options(voice=voice)
+
+    # Inicializar gerenciador de gravação
+    rm = RecordingManager(
+        room_name=room_name,
+        session_id=config.get("session_id", "unknown"),
+        customer_id=str(config.get("customer_id", "unknown"))
+    )
+    
+    state = _registry.create(room_name, config, tm, rm)
+
+    # Diário local da sessão (sobrevive a crash do worker)
+    if TRANSCRIPT_STORE_ENABLED:
+        tm.attach_store(_transcript_store, _transcript_store.open_session(room_name, config))
+
+    # Avaliação incremental (resume trechos durante a ligação)
+    evaluator: Optional[IncrementalEvaluator] = None
+    if INCREMENTAL_EVALUATION_ENABLED:
+        evaluator = IncrementalEvaluator(tm, config)
+        tm.add_listener(evaluator.on_message)
+    state["evaluator"] = evaluator
+
+    # Tokens da Realtime API servidos do cache de prompt
+    prompt_cache = PromptCacheTracker()
+
+    # Watchdog do event loop: lag + callbacks lentos da sessão
+    watchdog = LoopWatchdog()
+    watchdog.start()
+
+    # Tasks da sessão: as que ainda estiverem pendentes são canceladas no teardown
+    tasks: set = set()
+
+    def spawn(coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        return task
+
+    def finish(coro):
+        """Dispara o encerramento (parar gravação + avaliar) e guarda a task."""
+        state["end_task"] = spawn(coro)
+
+    # Prazos da sessão (time_limit e silêncio) no timer wheel do worker
+    def end_session(reason: str):
+        """Encerramento pelo agent: tempo esgotado ou silêncio."""
+        if state["ending"]:
+            return
+        state["ending"] = True
+        tm.send_auto_end(reason=reason)
+        finish(stop_recording_and_evaluate(tm, config, rm, evaluator))
+
+    timers = SessionTimers(tm, session, state, end_session, _time_limit_seconds(config))
+
+    async def teardown(reason: str):
+        """Libera os recursos da sessão: egress, avaliação, DataChannel e sessão Realtime."""
+        logger.info(f"🧹 Encerrando sessão ({reason})...")
+        watchdog.stop()
+        timers.cancel()
+        cancel_participant_left()
+
+        if state["started"] and state.get("end_task") is None:
+            # Usuário sumiu sem end_simulation: parar gravação e enfileirar a avaliação
+            state["ending"] = True
+            finish(stop_recording_and_evaluate(tm, config, rm, evaluator, defer=True))
+        end_task = state.get("end_task")
+        if end_task is not None and not end_task.done():
+            await asyncio.wait({end_task})
+
+        # Egress pré-armado ou ainda ativo (encerramento falhou ou nunca iniciou)
+        if rm.active:
+            await rm.stop_recording()
+
+        tm.flush()
+        await tm.publisher.aclose()
+        await session.aclose()
+
+    async def run_teardown(reason: str):
+        t0 = time.perf_counter()
+        try:
+            await asyncio.wait_for(teardown(reason), SESSION_TEARDOWN_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ Encerramento passou de {SESSION_TEARDOWN_TIMEOUT_SECONDS:.0f}s - forçando")
+        except Exception as e:
+            logger.error(f"❌ Erro no encerramento da sessão: {e}")
+        # Avaliação interrompida aqui fica no spool: a lease expira e a fila do worker assume
+        pending = [task for task in tasks if not task.done()]
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.wait(pending, timeout=1.0)
+        if state.pop("bvc", False):
+            METRIC_BVC_SESSIONS.dec()
+        logger.info(f"🐢 Event loop: {watchdog.stats()}")
+        logger.info(f"⏱️ Latência da sessão: {tm.latency.summary()}")
+        logger.info(f"🧠 Cache de prompt: {prompt_cache.summary()}")
+        logger.info(f"📡 DataChannel: {tm.publisher.stats()}")
+        if tm.store_key:
+            tm.record("closed", {"reason": reason})
+            # Garante o diário no disco antes do processo do job terminar
+            if not await asyncio.to_thread(_transcript_store.flush, 2.0):
+                logger.warning("⚠️ Diário da sessão não confirmou a gravação em 2s")
+            logger.info(f"💾 Diário: {_transcript_store.stats()}")
+        _registry.close(room_name, reason=reason, state=state)
+        # Clientes HTTP do processo só fecham depois do egress parado e da avaliação
+        # enfileirada (callbacks de shutdown do LiveKit rodam em paralelo com isto)
+        await _openai_pool.aclose()
+        await _livekit_api_pool.aclose()
+        logger.info(f"   └─ Encerramento em {(time.perf_counter() - t0) * 1000:.0f}ms")
+
+    def request_teardown(reason: str) -> asyncio.Task:
+        """Dispara o teardown uma única vez (disconnect e shutdown compartilham a task)."""
+        if state.get("teardown") is None:
+            state["teardown"] = asyncio.create_task(run_teardown(reason))
+        return state["teardown"]
+
+    # Remoções do registro (TTL, limite de tamanho) passam pelo mesmo teardown
+    state["request_teardown"] = request_teardown
+
+    # Liberar a sessão no shutdown do job e no disconnect da room
+    async def close_session(*_args):
+        await request_teardown("shutdown")
+
+    ctx.add_shutdown_callback(close_session)
+
+    @ctx.room.on("disconnected")
+    @watchdog.timed
+    def on_room_disconnected(*_args):
+        request_teardown("disconnected")
+
+    def check_participant_left():
+        state["left_timer"] = None
+        if state.get("teardown") is None and not _has_human_participants(ctx.room):
+            logger.info(f"👋 Usuário não voltou em {PARTICIPANT_LEFT_GRACE_SECONDS:.0f}s - encerrando o job")
+            ctx.shutdown(reason="participant_left")
+
+    def cancel_participant_left():
+        if state.get("left_timer") is not None:
+            _timer_wheel.cancel(state.pop("left_timer"))
+
+    @ctx.room.on("participant_disconnected")
+    @watchdog.timed
+    def on_participant_disconnected(participant: rtc.RemoteParticipant):
+        if not _has_human_participants(ctx.room):
+            logger.info(f"👋 Usuário saiu da room ({participant.identity}) - aguardando {PARTICIPANT_LEFT_GRACE_SECONDS:.0f}s")
+            # Um único prazo por sessão: cada saída recomeça a contagem
+            cancel_participant_left()
+            state["left_timer"] = _timer_wheel.schedule(PARTICIPANT_LEFT_GRACE_SECONDS, check_participant_left)
+
+    @ctx.room.on("participant_connected")
+    @watchdog.timed
+    def on_participant_connected(participant: rtc.RemoteParticipant):
+        if state.get("left_timer") is not None and _has_human_participants(ctx.room):
+            logger.info(f"👋 Usuário voltou à room ({participant.identity})")
+            cancel_participant_left()
+
     # ========================================
     # 6. REGISTRAR CALLBACKS
     # ========================================
@@ -633,12 +3700,21 @@ async def entrypoint(ctx: JobContext):
     _using_speech_committed = False
 
     @session.on("user_input_transcribed")
+    @watchdog.timed
     def on_user_transcribed(event):
         """Captura transcrição do usuário."""
         if hasattr(event, 'transcript') and event.transcript:
-            tm.add_user_message(event.transcript)
+            _registry.touch(room_name)
+            timers.activity()
+            if getattr(event, 'is_final', True):
+                tm.latency.transcription_received()
+                tm.add_user_message(event.transcript)
+            else:
+                # Parcial: só vira legenda (a versão final entra no histórico)
+                tm.caption_user(event.transcript)
 
     @session.on("agent_speech_committed")
+    @watchdog.timed
     def on_agent_speech(event):
         """Captura fala da IA quando commitada."""
         nonlocal _using_speech_committed
@@ -646,16 +3722,18 @@ async def entrypoint(ctx: JobContext):
         
         if hasattr(event, 'content') and event.content:
             text = event.content
+            item_id = getattr(event, 'item_id', None) or getattr(event, 'id', None)
             if tm.check_for_end_signal(text):
-                if not _sessions[room_name]["ending"]:
-                    _sessions[room_name]["ending"] = True
-                    tm.add_ai_message(text)
+                if not state["ending"]:
+                    state["ending"] = True
+                    tm.add_ai_message(text, item_id)
                     tm.send_auto_end()
-                    asyncio.create_task(handle_auto_end(tm, config, rm))
+                    finish(handle_auto_end(tm, config, rm, evaluator))
             else:
-                tm.add_ai_message(text)
+                tm.add_ai_message(text, item_id)
 
     @session.on("conversation_item_added")
+    @watchdog.timed
     def on_item_added(event):
         """Captura mensagens da conversa (fallback)."""
         item = getattr(event, 'item', None)
@@ -676,29 +3754,55 @@ async def entrypoint(ctx: JobContext):
         if role == 'assistant' and not _using_speech_committed:
             content = getattr(item, 'content', None)
             text = _extract_text_from_content(content)
+            item_id = getattr(item, 'id', None)
             if text:
                 if tm.check_for_end_signal(text):
-                    if not _sessions[room_name]["ending"]:
-                        _sessions[room_name]["ending"] = True
-                        tm.add_ai_message(text)
+                    if not state["ending"]:
+                        state["ending"] = True
+                        tm.add_ai_message(text, item_id)
                         tm.send_auto_end()
-                        asyncio.create_task(handle_auto_end(tm, config, rm))
+                        finish(handle_auto_end(tm, config, rm, evaluator))
                 else:
-                    tm.add_ai_message(text)
+                    tm.add_ai_message(text, item_id)
 
     @session.on("agent_started_speaking")
+    @watchdog.timed
     def on_started():
+        tm.latency.agent_started_speaking()
         tm.send_status("agent_speaking")
 
+    @session.on("user_state_changed")
+    @watchdog.timed
+    def on_user_state(event):
+        """Fim da fala do usuário (VAD) inicia a medição do turno."""
+        timers.activity()
+        if event.old_state == "speaking" and event.new_state == "listening":
+            tm.latency.user_stopped_speaking()
+
+    @session.on("agent_state_changed")
+    @watchdog.timed
+    def on_agent_state(event):
+        if event.new_state == "speaking":
+            timers.activity()
+            tm.latency.agent_started_speaking()
+
     @session.on("agent_stopped_speaking")
+    @watchdog.timed
     def on_stopped():
         tm.send_status("agent_listening")
 
+    @session.on("metrics_collected")
+    @watchdog.timed
+    def on_metrics(event):
+        """Tokens de cada resposta do modelo Realtime (cache de prompt)."""
+        prompt_cache.on_metrics(getattr(event, "metrics", None))
+
     # ========================================
     # 7. HANDLER DE COMANDOS DO FRONTEND
     # ========================================
 
     @ctx.room.on("data_received")
+    @watchdog.timed
     def on_data_received(data: rtc.DataPacket):
         try:
             payload = data.data if hasattr(data, 'data') else data
@@ -707,25 +3811,36 @@ async def entrypoint(ctx: JobContext):
 
             message = json.loads(payload)
             msg_type = message.get("type", "")
+            _registry.touch(room_name)
 
             if msg_type == "start_simulation":
-                if _sessions[room_name]["started"]:
+                if state["started"]:
                     return
-                _sessions[room_name]["started"] = True
-                _sessions[room_name]["ending"] = False
+                state["started"] = True
+                state["ending"] = False
                 logger.info("▶️ SIMULAÇÃO INICIADA")
+                tm.record("started")
+                timers.start()
+
+                # Frontend que entende pacotes "batch" recebe mensagens agrupadas
+                tm.publisher.batching = bool(message.get("batch", False))
+                # Frontend que entende "append" recebe só o texto novo das falas da IA
+                tm.append_deltas = bool(message.get("append", False))
+                # Formato das mensagens: "json" (padrão) ou "msgpack" (compacto)
+                encoding = tm.publisher.set_encoding(message.get("encoding", "json"))
+                logger.info(f"   └─ DataChannel: {encoding}{' + batch' if tm.publisher.batching else ''}")
                 
                 # 🎬 INICIAR GRAVAÇÃO
-                asyncio.create_task(start_recording_and_greet(session, rm, config, tm))
+                spawn(start_recording_and_greet(session, rm, config, tm))
 
             elif msg_type == "end_simulation":
-                if _sessions[room_name]["ending"]:
+                if state["ending"]:
                     return
-                _sessions[room_name]["ending"] = True
+                state["ending"] = True
                 logger.info("🏁 SIMULAÇÃO ENCERRADA (pelo usuário)")
                 
                 # 🛑 PARAR GRAVAÇÃO E AVALIAR
-                asyncio.create_task(stop_recording_and_evaluate(tm, config, rm))
+                finish(stop_recording_and_evaluate(tm, config, rm, evaluator))
 
         except Exception as e:
             logger.error(f"❌ Erro ao processar comando: {e}")
@@ -752,6 +3867,8 @@ async def entrypoint(ctx: JobContext):
             room=ctx.room, 
             agent=agent,
             room_options=room_io.RoomOptions(
+                # Usuário que cai ou recarrega a página pode voltar: o teardown é nosso
+                close_on_disconnect=False,
                 audio_input=room_io.AudioInputOptions(
                     # BVC = Background Voice Cancellation
                     # Remove TANTO ruídos de fundo QUANTO vozes de outras pessoas
@@ -760,9 +3877,25 @@ async def entrypoint(ctx: JobContext):
                 ),
             ),
         )
+        state["bvc"] = True
+        METRIC_BVC_SESSIONS.inc()
     else:
         logger.info("🔇 Noise Cancellation: DESABILITADO")
-        await session.start(room=ctx.room, agent=agent)
+        await session.start(
+            room=ctx.room,
+            agent=agent,
+            room_options=room_io.RoomOptions(close_on_disconnect=False),
+        )
+
+    # Legendas em streaming: deltas da IA chegam pela saída de transcrição
+    if config.get("streaming_captions"):
+        tm.captions_enabled = True
+        session.output.transcription = CaptionTextOutput(tm, next_in_chain=session.output.transcription)
+        logger.info("💬 Legendas em streaming: HABILITADAS")
+
+    # Pré-armar a gravação: o egress já está rodando quando o usuário iniciar
+    if RECORDING_START_MODE == "prearm":
+        rm.start_recording_task()
 
     logger.info("✅ PRONTO - Aguardando comando 'start_simulation'")
     logger.info(f"   └─ Modo: OpenAI Realtime API (Speech-to-Speech)")
@@ -770,28 +3903,84 @@ async def entrypoint(ctx: JobContext):
     logger.info(f"   └─ Gravação: {'HABILITADA' if RECORDING_ENABLED else 'DESABILITADA'}")
     logger.info(f"   └─ Noise Cancel: {'BVC (vozes+ruídos)' if NOISE_CANCELLATION_ENABLED else 'DESABILITADO'}")
     logger.info(f"   └─ Latência esperada: ~300-800ms")
-    logger.info(f"{'='*60}")
+    _log_startup_timing(ctx, t_job_start)
+    log_separator()
+
+
+def _log_startup_timing(ctx: JobContext, t_job_start: float):
+    """Loga o tempo de inicialização do job até o PRONTO."""
+    job_ms = (time.perf_counter() - t_job_start) * 1000
+    logger.info(f"   └─ Inicialização do job: {job_ms:.0f}ms")
+
+    # creation_time da room vem em segundos (epoch) do LiveKit
+    creation_time = getattr(ctx.job.room, "creation_time", 0) if ctx.job else 0
+    if creation_time:
+        room_ms = (time.time() - creation_time) * 1000
+        logger.info(f"   └─ Desde a criação da room: {room_ms:.0f}ms")
+
+    if "prewarm_timings" in ctx.proc.userdata:
+        logger.info(f"   └─ Prewarm: reaproveitado")
+    else:
+        logger.info(f"   └─ Prewarm: não executado (processo frio)")
 
 
 async def start_recording_and_greet(session: AgentSession, rm: RecordingManager, config: dict, tm: TranscriptionManager):
-    """Inicia gravação e depois fala a saudação."""
-    # Primeiro iniciar a gravação
-    recording_started = await rm.start_recording()
+    """Inicia gravação e fala a saudação (em série ou com espera limitada)."""
+    greeting = config.get("greeting", "Alô?")
+
+    if RECORDING_START_MODE == "serial":
+        # Primeiro iniciar a gravação, depois falar a saudação
+        _log_recording_started(await rm.start_recording())
+        await speak_greeting(session, greeting, tm, voice=config.get("voice", "ash"))
+        return
+
+    # parallel/prearm: a saudação espera a gravação (no prearm ela normalmente
+    # já começou), mas nunca mais que RECORDING_START_GUARD_MS
+    recording_task = rm.start_recording_task()
+    done, _ = await asyncio.wait({recording_task}, timeout=RECORDING_START_GUARD_MS / 1000)
+    if recording_task in done:
+        _log_recording_started(recording_task.result())
+    else:
+        logger.warning(f"⚠️ Gravação não iniciou em {RECORDING_START_GUARD_MS}ms - saudação segue sem esperar (pode não ser gravada)")
+        recording_task.add_done_callback(lambda t: _log_recording_started(not t.cancelled() and t.result()))
+
+    await speak_greeting(session, greeting, tm, voice=config.get("voice", "ash"))
+
+
+def _log_recording_started(recording_started: bool):
     if recording_started:
         logger.info("✅ Gravação iniciada com sucesso")
     else:
         logger.warning("⚠️ Gravação não iniciada (continuando sem gravação)")
-    
-    # Depois falar a saudação
-    greeting = config.get("greeting", "Alô?")
-    await speak_greeting(session, greeting, tm)
 
 
-async def speak_greeting(session: AgentSession, greeting: str, tm: TranscriptionManager):
-    """Fala a saudação inicial usando generate_reply."""
+async def speak_greeting(session: AgentSession, greeting: str, tm: TranscriptionManager, voice: str = "ash"):
+    """Fala a saudação inicial: áudio em cache ou, se não houver, generate_reply.
+
+    O pedido da saudação é só o sufixo: o plugin o anexa às instruções da sessão.
+    """
     logger.info(f"📞 Saudação: '{greeting}'")
     tm._greeting_sent = True
-    
+    tm.latency.greeting_requested()
+
+    if GREETING_CACHE_ENABLED:
+        pcm = await _greeting_cache.get(greeting, voice)
+        if pcm:
+            logger.info(f"⚡ Saudação do cache ({voice})")
+            try:
+                await session.say(
+                    greeting,
+                    audio=_greeting_cache.frames(pcm),
+                    allow_interruptions=False,
+                    add_to_chat_ctx=True,
+                )
+                return
+            except Exception as e:
+                logger.warning(f"⚠️ Erro ao tocar saudação do cache: {e}")
+        else:
+            # Miss: gerar o áudio em background para as próximas sessões
+            asyncio.create_task(_greeting_cache.render(greeting, voice))
+
     try:
         await session.generate_reply(
             instructions=f"Você está atendendo uma ligação. Diga EXATAMENTE: \"{greeting}\" - Não adicione nada antes ou depois."
@@ -800,8 +3989,14 @@ async def speak_greeting(session: AgentSession, greeting: str, tm: Transcription
         logger.warning(f"⚠️ Erro na saudação: {e}")
 
 
-async def stop_recording_and_evaluate(tm: TranscriptionManager, config: dict, rm: RecordingManager):
-    """Para a gravação e gera avaliação."""
+async def stop_recording_and_evaluate(
+    tm: TranscriptionManager,
+    config: dict,
+    rm: RecordingManager,
+    evaluator: Optional[IncrementalEvaluator] = None,
+    defer: bool = False,
+):
+    """Para a gravação e gera avaliação (`defer`: só enfileira)."""
     # Parar gravação primeiro
     recording_result = await rm.stop_recording()
 
@@ -814,19 +4009,33 @@ async def stop_recording_and_evaluate(tm: TranscriptionManager, config: dict, rm
             "s3_url": recording_result["s3_url"],
         }
         logger.info(f"✅ Gravação disponível: {recording_result['s3_url']}")
+        tm.record("recording", recording_info)
 
         # Enviar dados de gravação para o frontend imediatamente
         tm._send_to_frontend("recording_ready", recording_info)
 
-    # Gerar avaliação (descomentado e passando recording_info)
-    await generate_evaluation(tm, config, recording_info)
+    # Gerar avaliação via fila (passando recording_info)
+    await _evaluation_queue.submit(tm, config, recording_info, evaluator, defer=defer)
 
 
-async def handle_auto_end(tm: TranscriptionManager, config: dict, rm: RecordingManager):
+async def handle_auto_end(
+    tm: TranscriptionManager,
+    config: dict,
+    rm: RecordingManager,
+    evaluator: Optional[IncrementalEvaluator] = None,
+):
     """Lida com encerramento automático pela IA."""
     logger.info("🤖 IA encerrou a conversa automaticamente")
     await asyncio.sleep(1.5)
-    await stop_recording_and_evaluate(tm, config, rm)
+    await stop_recording_and_evaluate(tm, config, rm, evaluator)
+
+
+def _has_human_participants(room: rtc.Room) -> bool:
+    """Se ainda há participantes comuns (não agents/egress) na room."""
+    return any(
+        getattr(p, "kind", rtc.ParticipantKind.PARTICIPANT_KIND_STANDARD) == rtc.ParticipantKind.PARTICIPANT_KIND_STANDARD
+        for p in room.remote_participants.values()
+    )
 
 
 def _extract_text_from_content(content) -> Optional[str]:
@@ -855,6 +4064,7 @@ def _extract_text_from_content(content) -> Optional[str]:
 # ============================================================
 
 if __name__ == "__main__":
+    setup_logging()
     print("""
 ╔══════════════════════════════════════════════════════════════════════════════╗
 ║             🎭 LIVEKIT ROLEPLAY AGENT - REALTIME API + BVC                   ║
@@ -900,7 +4110,33 @@ if __name__ == "__main__":
         print(f"   └─ Isola voz principal")
     else:
         print(f"ℹ️ Noise Cancellation: DESABILITADO")
+
+    # Limites de carga
+    print(f"✅ Carga: máx {MAX_CONCURRENT_SESSIONS} sessões, threshold {LOAD_THRESHOLD}")
+
+    # Métricas
+    if METRICS_PORT > 0:
+        print(f"✅ Métricas: http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+    else:
+        print(f"ℹ️ Métricas: DESABILITADAS")
     
     print()
 
-    cli.run_app(WorkerOptions(entrypoint_fnc=entrypoint))
+    # Fila de avaliações e endpoint de métricas rodam no processo principal, fora dos jobs
+    if len(sys.argv) > 1 and sys.argv[1] in ("start", "dev"):
+        if TRANSCRIPT_STORE_ENABLED:
+            # Antes da fila: sessões interrompidas por crash voltam para a avaliação
+            try:
+                recovered = _transcript_store.recover(_evaluation_spool)
+                print(f"✅ Diário de transcrições: {TRANSCRIPT_STORE_PATH} {recovered}")
+            except Exception as e:
+                print(f"⚠️ Diário de transcrições: recuperação falhou ({e})")
+        threading.Thread(target=_run_evaluation_queue, name="evaluation-queue", daemon=True).start()
+        start_metrics_server()
+
+    cli.run_app(WorkerOptions(
+        entrypoint_fnc=entrypoint,
+        prewarm_fnc=prewarm,
+        load_fnc=WorkerLoadCalculator(),
+        load_threshold=LOAD_THRESHOLD,
+    ))
@@ -0,0 +1,634 @@
+"""
+============================================
+BENCHMARK OFFLINE - CARGA DO ROLEPLAY AGENT
+============================================
+
+Executa o `entrypoint()` do agent.py contra fakes em processo (JobContext,
+Room, modelo Realtime, Egress API e chat completions) e reproduz conversas
+roteirizadas com N sessões simultâneas, sem gastar créditos de API.
+
+Cada sessão segue o fluxo real: metadata → start_simulation → saudação →
+turnos (fim da fala, transcrição parcial/final, resposta da IA) →
+[ENCERRAR_LIGACAO] ou end_simulation → parada da gravação → avaliação.
+
+Relatório: throughput (sessões e turnos por segundo), latência por turno
+medida pelo agent, custo dos callbacks por evento, mensagens/bytes no
+DataChannel, memória por sessão e CPU.
+
+Uso:
+    python benchmark.py --concurrency 20 --sessions 100
+    python benchmark.py --concurrency 50 --speed 20 --script conversa.json --json
+
+O roteiro (--script) é uma lista JSON de turnos: [{"user": "...", "ai": "..."}].
+Os atrasos simulados (fala, modelo, egress, avaliação) são divididos por --speed.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+from typing import Optional
+
+# Ambiente do benchmark (antes de importar o agent, que lê a configuração no import)
+_BENCH_DIR = tempfile.mkdtemp(prefix="roleplay-bench-")
+for _key, _value in {
+    "LIVEKIT_URL": "ws://benchmark.invalid",
+    "LIVEKIT_API_KEY": "benchmark",
+    "LIVEKIT_API_SECRET": "benchmark",
+    "OPENAI_API_KEY": "benchmark",
+    "AWS_BUCKET_NAME": "benchmark",
+    "AWS_ACCESS_KEY_ID": "benchmark",
+    "AWS_SECRET_ACCESS_KEY": "benchmark",
+    "RECORDING_ENABLED": "true",
+    "NOISE_CANCELLATION_ENABLED": "false",
+    "GREETING_CACHE_ENABLED": "false",
+    "METRICS_PORT": "0",
+    "LOG_LEVEL": "WARNING",
+    "EVALUATION_SPOOL_PATH": os.path.join(_BENCH_DIR, "evaluations.db"),
+    "TRANSCRIPT_STORE_PATH": os.path.join(_BENCH_DIR, "transcripts.db"),
+}.items():
+    os.environ.setdefault(_key, _value)
+
+import agent  # noqa: E402
+from livekit import api  # noqa: E402
+
+
+DEFAULT_SCRIPT = [
+    {"user": "Bom dia, aqui é o Carlos da TechSolutions, tudo bem?", "ai": "Tudo bem. Quem fala? Do que se trata?"},
+    {"user": "Estou ligando para apresentar nosso sistema de gestão de estoque.", "ai": "Hum, já temos um sistema. Por que eu trocaria?"},
+    {"user": "Nosso sistema reduz em média 30% as perdas de estoque.", "ai": "Trinta por cento? Como vocês medem isso?"},
+    {"user": "Temos casos de clientes do seu segmento, posso enviar os números.", "ai": "Pode mandar. E quanto custa?"},
+    {"user": "O plano começa em 490 reais por mês, com implantação inclusa.", "ai": "Está um pouco acima do que pagamos hoje."},
+    {"user": "Posso oferecer o primeiro mês gratuito para vocês testarem.", "ai": "Certo, vou pensar. Me manda a proposta por e-mail. Até mais! [ENCERRAR_LIGACAO]"},
+]
+
+EVALUATION_RESULT = {
+    "overall_score": 7.5,
+    "summary": "Avaliação sintética gerada pelo benchmark.",
+    "criteria_scores": [],
+    "strengths": ["Abertura clara"],
+    "improvements": ["Explorar melhor as objeções de preço"],
+}
+
+
+# ============================================================
+# FAKES
+# ============================================================
+
+class FakeEmitter:
+    """EventEmitter mínimo compatível com `.on(evento)` como decorator."""
+
+    def __init__(self):
+        self._handlers: dict = {}
+        self.dispatch_times: list = []
+
+    def on(self, event: str, callback=None):
+        if callback is None:
+            def decorator(fn):
+                self._handlers.setdefault(event, []).append(fn)
+                return fn
+            return decorator
+        self._handlers.setdefault(event, []).append(callback)
+        return callback
+
+    def off(self, event: str, callback):
+        handlers = self._handlers.get(event, [])
+        if callback in handlers:
+            handlers.remove(callback)
+
+    def emit(self, event: str, *args):
+        t0 = time.perf_counter()
+        for handler in list(self._handlers.get(event, [])):
+            handler(*args)
+        self.dispatch_times.append(time.perf_counter() - t0)
+
+
+class FakeLocalParticipant:
+    """Participante local: conta o que o agent publica e detecta o fim da sessão."""
+
+    def __init__(self, session: "BenchSession"):
+        self.session = session
+
+    async def publish_data(self, payload: bytes, reliable: bool = True, **kwargs):
+        self.session.packets += 1
+        self.session.bytes += len(payload)
+        self.session.on_payload(payload)
+
+
+class FakeRoom(FakeEmitter):
+    def __init__(self, name: str, metadata: str, session: "BenchSession"):
+        super().__init__()
+        self.name = name
+        self.metadata = metadata
+        self.remote_participants = {"user": SimpleNamespace(identity="user", metadata="")}
+        self.local_participant = FakeLocalParticipant(session)
+        self.creation_time = 0
+
+
+class FakeJobContext:
+    def __init__(self, room: FakeRoom, userdata: dict):
+        self.room = room
+        self.proc = SimpleNamespace(userdata=userdata)
+        self.job = SimpleNamespace(id=f"job-{room.name}", room=room)
+        self._shutdown_callbacks: list = []
+
+    async def connect(self):
+        await asyncio.sleep(0)
+
+    def add_shutdown_callback(self, callback):
+        self._shutdown_callbacks.append(callback)
+
+    async def shutdown(self):
+        for callback in self._shutdown_callbacks:
+            try:
+                await callback()
+            except Exception as e:
+                print(f"⚠️ Erro no shutdown callback: {e}", file=sys.stderr)
+
+
+class FakeRealtimeModel:
+    def __init__(self, **kwargs):
+        self.options = kwargs
+
+    def update_options(self, **kwargs):
+        self.options.update(kwargs)
+
+
+# Instruções já vistas pelo "provedor" neste processo (cache de prompt simulado)
+_seen_instructions: set = set()
+
+
+class FakeAgentSession(FakeEmitter):
+    """Sessão que simula o modelo Realtime emitindo os eventos do LiveKit."""
+
+    def __init__(self, llm=None, **kwargs):
+        super().__init__()
+        self.llm = llm
+        self.output = SimpleNamespace(transcription=None)
+        self.bench: Optional["BenchSession"] = None
+        self._items = 0
+        self.instructions = ""
+        self._reply_instructions: Optional[str] = None
+        self._context_chars = 0
+
+    async def start(self, room=None, agent=None, room_options=None):
+        self.instructions = getattr(agent, "instructions", "")
+        await asyncio.sleep(0)
+
+    def response_metrics(self, text: str, ttft: float) -> SimpleNamespace:
+        """RealtimeModelMetrics de uma resposta, com as regras de cache da OpenAI.
+
+        Só prefixos de 1024+ tokens entram no cache, em blocos de 128; aqui
+        um token ~ 4 caracteres.
+        """
+        instructions = self._reply_instructions or self.instructions
+        self._reply_instructions = None
+        cacheable = self._context_chars // 4
+        if self.instructions in _seen_instructions:
+            cacheable += len(self.instructions) // 4
+        _seen_instructions.add(self.instructions)
+        cached = (cacheable // 128) * 128 if cacheable >= 1024 else 0
+        input_tokens = (len(instructions) + self._context_chars) // 4
+        self._context_chars += len(text)
+        return SimpleNamespace(
+            type="realtime_model_metrics",
+            input_tokens=input_tokens,
+            output_tokens=len(text) // 4,
+            ttft=ttft,
+            input_token_details=SimpleNamespace(cached_tokens=min(cached, input_tokens)),
+        )
+
+    async def say(self, text: str, audio=None, **kwargs):
+        await self.bench.ai_turn(text)
+
+    async def generate_reply(self, instructions: str = "", **kwargs):
+        # Como o RealtimeSession do plugin da OpenAI: instruções da sessão + as da resposta
+        if instructions:
+            self._reply_instructions = f"{self.instructions}\n{instructions}"
+        match = re.search(r'EXATAMENTE: "([^"]*)"', instructions)
+        await self.bench.ai_turn(match.group(1) if match else "Alô?")
+
+    async def aclose(self):
+        await asyncio.sleep(0)
+
+    def next_item_id(self) -> str:
+        self._items += 1
+        return f"item-{self._items}"
+
+
+class FakeEgressService:
+    def __init__(self, delay: float):
+        self.delay = delay
+        self._count = 0
+
+    async def start_room_composite_egress(self, req):
+        await asyncio.sleep(self.delay)
+        self._count += 1
+        return SimpleNamespace(egress_id=f"EG_bench_{self._count}", status="EGRESS_STARTING")
+
+    async def stop_egress(self, req):
+        await asyncio.sleep(self.delay)
+        return SimpleNamespace(egress_id=req.egress_id, status="EGRESS_ENDING")
+
+    async def list_egress(self, req):
+        return SimpleNamespace(items=[])
+
+
+class FakeRoomService:
+    """Entrega pela API do servidor (avaliações processadas pela fila)."""
+
+    def __init__(self, sessions: dict):
+        self.sessions = sessions
+
+    async def list_participants(self, req):
+        present = req.room in self.sessions
+        return SimpleNamespace(
+            participants=[SimpleNamespace(kind=api.ParticipantInfo.Kind.STANDARD)] if present else []
+        )
+
+    async def send_data(self, req):
+        session = self.sessions.get(req.room)
+        if session is not None:
+            session.on_payload(req.data)
+
+
+class FakeLiveKitAPI:
+    def __init__(self, egress_delay: float, sessions: dict):
+        self.egress = FakeEgressService(egress_delay)
+        self.room = FakeRoomService(sessions)
+
+    async def aclose(self):
+        pass
+
+
+class FakeCompletions:
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.calls = 0
+
+    async def create(self, model: str, messages: list, stream: bool = False, **kwargs):
+        self.calls += 1
+        prompt_tokens = sum(len(m["content"]) for m in messages) // 4
+        content = json.dumps(EVALUATION_RESULT, ensure_ascii=False)
+        usage = SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=len(content) // 4)
+        if not stream:
+            await asyncio.sleep(self.delay)
+            return SimpleNamespace(
+                choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=usage
+            )
+        return self._stream(content, usage)
+
+    async def _stream(self, content: str, usage):
+        step = 16
+        pieces = [content[i:i + step] for i in range(0, len(content), step)]
+        for piece in pieces:
+            await asyncio.sleep(self.delay / len(pieces))
+            yield SimpleNamespace(
+                choices=[SimpleNamespace(delta=SimpleNamespace(content=piece))], usage=None
+            )
+        yield SimpleNamespace(choices=[], usage=usage)
+
+
+class FakeOpenAI:
+    def __init__(self, delay: float):
+        self.chat = SimpleNamespace(completions=FakeCompletions(delay))
+
+
+# ============================================================
+# SESSÃO SIMULADA
+# ============================================================
+
+class BenchSession:
+    """Conduz uma conversa roteirizada contra o entrypoint."""
+
+    def __init__(self, index: int, script: list, args: argparse.Namespace):
+        self.index = index
+        self.room_name = f"bench-room-{index}"
+        self.script = script
+        self.args = args
+        self.packets = 0
+        self.bytes = 0
+        self.messages = 0
+        self.turns = 0
+        self.evaluated = asyncio.Event()
+        self.evaluation_type: Optional[str] = None
+        self.duration = 0.0
+        self.session: Optional[FakeAgentSession] = None
+        metadata = {
+            "session_id": f"bench-{index}",
+            "customer_id": "benchmark",
+            "roleplay_id": "benchmark",
+            "persona": {"name": "Cliente", "company": "Benchmark"},
+            "voice": {"name": "neutral"},
+            "prompts": {"greeting": "Alô?"},
+        }
+        if args.prompt_chars > 0:
+            # Persona do tamanho das reais (vários KB): mesmo texto em todas as sessões
+            base = agent.DEFAULT_CONFIG["system_prompt"] + "\n"
+            metadata["prompts"]["system"] = (base * (args.prompt_chars // len(base) + 1))[:args.prompt_chars]
+        self.room = FakeRoom(self.room_name, json.dumps(metadata), self)
+
+    def delay(self, ms: float) -> float:
+        return ms / 1000 / self.args.speed
+
+    def on_payload(self, payload: bytes):
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            return
+        messages = message.get("messages", []) if message.get("type") == "batch" else [message]
+        self.messages += len(messages)
+        for m in messages:
+            if m.get("type") in ("evaluation", "evaluation_error"):
+                self.evaluation_type = m["type"]
+                self.evaluated.set()
+
+    def send_command(self, msg_type: str):
+        self.room.emit("data_received", SimpleNamespace(data=json.dumps({"type": msg_type}).encode("utf-8")))
+
+    async def ai_turn(self, text: str):
+        """Resposta da IA: atraso do modelo, estado 'speaking' e item da conversa."""
+        session = self.session
+        ttft = self.delay(self.args.model_latency_ms)
+        await asyncio.sleep(ttft)
+        session.emit("agent_state_changed", SimpleNamespace(old_state="thinking", new_state="speaking"))
+        session.emit("metrics_collected", SimpleNamespace(metrics=session.response_metrics(text, ttft)))
+        item = SimpleNamespace(role="assistant", content=[text], id=session.next_item_id())
+        session.emit("conversation_item_added", SimpleNamespace(item=item))
+        await asyncio.sleep(self.delay(self.args.speech_ms))
+        session.emit("agent_state_changed", SimpleNamespace(old_state="speaking", new_state="listening"))
+
+    async def user_turn(self, text: str):
+        """Fala do usuário: transcrições parciais durante a fala e a final no fim."""
+        session = self.session
+        session.emit("user_state_changed", SimpleNamespace(old_state="listening", new_state="speaking"))
+        words = text.split()
+        interval = self.delay(self.args.speech_ms) / max(len(words), 1)
+        for i in range(1, len(words) + 1):
+            await asyncio.sleep(interval)
+            session.emit("user_input_transcribed", SimpleNamespace(transcript=" ".join(words[:i]), is_final=False))
+        session.emit("user_state_changed", SimpleNamespace(old_state="speaking", new_state="listening"))
+        await asyncio.sleep(self.delay(self.args.transcription_ms))
+        session.emit("user_input_transcribed", SimpleNamespace(transcript=text, is_final=True))
+
+    async def run(self, userdata: dict):
+        ctx = FakeJobContext(self.room, userdata)
+        t0 = time.perf_counter()
+        await agent.entrypoint(ctx)
+        self.session = _created_sessions.pop(self.room_name)
+        self.session.bench = self
+
+        self.send_command("start_simulation")
+        await asyncio.sleep(self.delay(self.args.model_latency_ms + self.args.speech_ms) * 1.5)
+
+        ended = False
+        for turn in self.script:
+            await asyncio.sleep(self.delay(self.args.turn_gap_ms))
+            await self.user_turn(turn["user"])
+            await self.ai_turn(turn["ai"])
+            self.turns += 1
+            if "[ENCERRAR_LIGACAO]" in turn["ai"]:
+                ended = True
+                break
+        if not ended:
+            self.send_command("end_simulation")
+
+        try:
+            await asyncio.wait_for(self.evaluated.wait(), timeout=self.args.evaluation_timeout)
+        except asyncio.TimeoutError:
+            self.evaluation_type = "timeout"
+
+        self.room.emit("disconnected")
+        await ctx.shutdown()
+        self.duration = time.perf_counter() - t0
+
+
+_created_sessions: dict = {}
+
+
+def _session_factory(llm=None, **kwargs) -> FakeAgentSession:
+    # O entrypoint cria a sessão internamente: registrá-la pela room atual
+    session = FakeAgentSession(llm=llm, **kwargs)
+    context = agent._log_context.get() or {}
+    _created_sessions[context.get("room")] = session
+    return session
+
+
+class BenchLatencyTracker(agent.LatencyTracker):
+    """LatencyTracker que também agrega as amostras de todas as sessões do benchmark."""
+
+    samples = agent.LatencyStats()
+
+    def _record(self, metric: str, started_at: float) -> float:
+        elapsed_ms = super()._record(metric, started_at)
+        BenchLatencyTracker.samples.record(metric, elapsed_ms)
+        return elapsed_ms
+
+
+class BenchPromptCacheTracker(agent.PromptCacheTracker):
+    """PromptCacheTracker que também agrega o cache de prompt de todas as sessões."""
+
+    totals = agent.PromptCacheStats()
+
+    def on_metrics(self, metrics) -> bool:
+        counted = super().on_metrics(metrics)
+        if counted:
+            details = getattr(metrics, "input_token_details", None)
+            BenchPromptCacheTracker.totals.add(
+                metrics.input_tokens or 0,
+                getattr(details, "cached_tokens", 0) or 0,
+                metrics.output_tokens or 0,
+                -1 if metrics.ttft is None else metrics.ttft,
+            )
+        return counted
+
+
+def install_fakes(args: argparse.Namespace, sessions: dict) -> FakeOpenAI:
+    """Substitui as dependências externas do agent pelos fakes."""
+    fake_openai = FakeOpenAI(args.evaluation_latency_ms / 1000 / args.speed)
+    fake_lkapi = FakeLiveKitAPI(args.egress_latency_ms / 1000 / args.speed, sessions)
+    agent.AgentSession = _session_factory
+    agent.Agent = lambda **kwargs: SimpleNamespace(**kwargs)
+    agent.openai = SimpleNamespace(realtime=SimpleNamespace(RealtimeModel=FakeRealtimeModel))
+    agent._openai_pool.get = lambda: fake_openai
+    agent._livekit_api_pool.get = lambda: fake_lkapi
+    # Os agregados do agent são por sessão (um job por processo); o benchmark roda todas aqui
+    agent.LatencyTracker = BenchLatencyTracker
+    agent.PromptCacheTracker = BenchPromptCacheTracker
+    return fake_openai
+
+
+# ============================================================
+# MEDIÇÃO
+# ============================================================
+
+def _rss_bytes() -> int:
+    """Memória residente atual do processo."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+async def _sample_rss(peak: list, interval: float = 0.1):
+    while True:
+        peak[0] = max(peak[0], _rss_bytes())
+        await asyncio.sleep(interval)
+
+
+def _ms_stats(values: list) -> dict:
+    if not values:
+        return {}
+    ordered = sorted(values)
+    return {
+        "count": len(ordered),
+        "avg_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "p50_ms": round(agent._percentile(ordered, 50) * 1000, 3),
+        "p95_ms": round(agent._percentile(ordered, 95) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+async def run_benchmark(args: argparse.Namespace) -> dict:
+    script = DEFAULT_SCRIPT
+    if args.script:
+        with open(args.script, encoding="utf-8") as f:
+            script = json.load(f)
+
+    sessions: dict = {}
+    fake_openai = install_fakes(args, sessions)
+    userdata = {"default_config": dict(agent.DEFAULT_CONFIG)}
+
+    queue_task = asyncio.create_task(agent._evaluation_queue.run())
+    semaphore = asyncio.Semaphore(args.concurrency)
+    results: list = []
+
+    async def run_one(index: int):
+        async with semaphore:
+            bench = BenchSession(index, script, args)
+            sessions[bench.room_name] = bench
+            try:
+                await bench.run(userdata)
+            finally:
+                sessions.pop(bench.room_name, None)
+            results.append(bench)
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    rss_base = _rss_bytes()
+    rss_peak = [rss_base]
+    rss_task = asyncio.create_task(_sample_rss(rss_peak))
+    cpu0 = time.process_time()
+    t0 = time.perf_counter()
+
+    await asyncio.gather(*(run_one(i) for i in range(args.sessions)))
+
+    wall = time.perf_counter() - t0
+    cpu = time.process_time() - cpu0
+    rss_task.cancel()
+    queue_task.cancel()
+    traced_peak = None
+    if args.tracemalloc:
+        traced_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    dispatch = [d for b in results for d in b.room.dispatch_times + b.session.dispatch_times]
+    outcomes: dict = {}
+    for b in results:
+        outcomes[b.evaluation_type] = outcomes.get(b.evaluation_type, 0) + 1
+    turns = sum(b.turns for b in results)
+    concurrent = min(args.concurrency, args.sessions)
+
+    report = {
+        "sessions": len(results),
+        "concurrency": args.concurrency,
+        "speed": args.speed,
+        "wall_s": round(wall, 2),
+        "throughput": {
+            "sessions_per_s": round(len(results) / wall, 3),
+            "turns_per_s": round(turns / wall, 2),
+        },
+        "session_duration": _ms_stats([b.duration for b in results]),
+        "agent_latency": BenchLatencyTracker.samples.summary(),
+        "prompt_cache": BenchPromptCacheTracker.totals.summary(),
+        "callback_dispatch": _ms_stats(dispatch),
+        "datachannel": {
+            "messages": sum(b.messages for b in results),
+            "packets": sum(b.packets for b in results),
+            "bytes": sum(b.bytes for b in results),
+            "bytes_per_session": round(sum(b.bytes for b in results) / max(len(results), 1)),
+        },
+        "evaluations": outcomes,
+        "chat_completions_calls": fake_openai.chat.completions.calls,
+        "memory": {
+            "rss_base_mb": round(rss_base / 2**20, 1),
+            "rss_peak_mb": round(rss_peak[0] / 2**20, 1),
+            "per_session_kb": round((rss_peak[0] - rss_base) / 1024 / max(concurrent, 1), 1),
+        },
+        "cpu": {
+            "cpu_s": round(cpu, 2),
+            "utilization": round(cpu / wall, 3),
+            "cpu_ms_per_session": round(cpu * 1000 / max(len(results), 1), 1),
+            "cpu_ms_per_turn": round(cpu * 1000 / max(turns, 1), 2),
+        },
+    }
+    if traced_peak is not None:
+        report["memory"]["traced_peak_per_session_kb"] = round(traced_peak / 1024 / max(concurrent, 1), 1)
+    return report
+
+
+def _print_report(report: dict):
+    print("=" * 60)
+    print(f"📊 BENCHMARK: {report['sessions']} sessões, {report['concurrency']} simultâneas (speed x{report['speed']})")
+    print("=" * 60)
+    print(f"⏱️ Tempo total: {report['wall_s']}s")
+    print(f"🚀 Throughput: {report['throughput']['sessions_per_s']} sessões/s, {report['throughput']['turns_per_s']} turnos/s")
+    print(f"   └─ Duração por sessão: {report['session_duration']}")
+    print(f"⏱️ Latência medida pelo agent: {report['agent_latency']}")
+    print(f"🧠 Cache de prompt (simulado): {report['prompt_cache']}")
+    print(f"🐢 Custo dos callbacks por evento: {report['callback_dispatch']}")
+    print(f"📡 DataChannel: {report['datachannel']}")
+    print(f"📊 Avaliações: {report['evaluations']} ({report['chat_completions_calls']} chamadas de chat completions)")
+    print(f"💾 Memória: {report['memory']}")
+    print(f"🔥 CPU: {report['cpu']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline do roleplay agent")
+    parser.add_argument("--concurrency", type=int, default=10, help="sessões simultâneas")
+    parser.add_argument("--sessions", type=int, default=None, help="total de sessões (padrão: = concurrency)")
+    parser.add_argument("--script", help="roteiro JSON: [{\"user\": ..., \"ai\": ...}]")
+    parser.add_argument("--speed", type=float, default=10.0, help="divide os atrasos simulados")
+    parser.add_argument("--model-latency-ms", type=float, default=500, help="atraso do modelo Realtime até o áudio")
+    parser.add_argument("--speech-ms", type=float, default=2000, help="duração de cada fala")
+    parser.add_argument("--transcription-ms", type=float, default=150, help="atraso da transcrição final")
+    parser.add_argument("--turn-gap-ms", type=float, default=500, help="pausa entre turnos")
+    parser.add_argument("--egress-latency-ms", type=float, default=300, help="latência da Egress API")
+    parser.add_argument("--evaluation-latency-ms", type=float, default=3000, help="latência das chat completions")
+    parser.add_argument("--evaluation-timeout", type=float, default=60, help="espera máxima pela avaliação (s)")
+    parser.add_argument("--prompt-chars", type=int, default=6000, help="tamanho do prompt da persona (0 = padrão)")
+    parser.add_argument("--tracemalloc", action="store_true", help="mede alocações Python (mais lento)")
+    parser.add_argument("--json", action="store_true", help="imprime o relatório em JSON")
+    args = parser.parse_args()
+    agent.setup_logging()
+    if args.sessions is None:
+        args.sessions = args.concurrency
+
+    report = asyncio.run(run_benchmark(args))
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        _print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""
+============================================
+REPLAY DE CONVERSAS GRAVADAS (CORPUS)
+============================================
+
+Reproduz conversas do corpus (corpus/*.jsonl) nos callbacks reais do
+`entrypoint()` (mesmos fakes do benchmark.py) e mede:
+- custo de processamento por evento (por tipo de evento)
+- mensagens/pacotes/bytes enviados ao frontend
+- se o histórico final bate com o esperado
+- custo de montar o prompt da avaliação (`build_evaluation_prompt`)
+
+Formato do corpus (JSONL, um objeto por linha, campo "event"):
+    {"event": "meta", "name": "...", "cases": ["..."], "options": {"encoding": "json", "batch": false, "append": false}}
+    {"t": 1200, "event": "user_input_transcribed", "transcript": "Alô", "is_final": true}
+    {"t": 2100, "event": "agent_speech_committed", "content": "Oi!", "item_id": "item_1"}
+    {"t": 2150, "event": "conversation_item_added", "role": "assistant", "content": ["Oi!"], "id": "item_1"}
+    {"t": 2200, "event": "agent_state_changed", "old_state": "thinking", "new_state": "speaking"}
+    {"event": "expect", "history": [{"role": "user", "content": "Alô"}, ...]}
+
+`t` é o instante do evento em ms desde o início da gravação. Eventos de
+`conversation_item_added` levam os campos do item (role, content, id).
+
+Uso:
+    python replay.py                           # todos os arquivos de corpus/
+    python replay.py corpus/duplicados.jsonl --speed 0 --iterations 20
+    python replay.py --json --output atual.json --baseline anterior.json
+    python replay.py --update                  # regrava o histórico esperado
+"""
+
+import argparse
+import asyncio
+import glob
+import json
+import os
+import statistics
+import sys
+import time
+from types import SimpleNamespace
+
+import benchmark
+from benchmark import FakeJobContext, FakeRoom, agent
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+
+
+class ReplayCounters:
+    """Contadores do que o agent publica na room (interface do BenchSession)."""
+
+    def __init__(self):
+        self.packets = 0
+        self.bytes = 0
+
+    def on_payload(self, payload: bytes):
+        pass
+
+
+def load_corpus(path: str) -> dict:
+    meta, events, expected = {}, [], None
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            entry = json.loads(line)
+            kind = entry.pop("event")
+            if kind == "meta":
+                meta = entry
+            elif kind == "expect":
+                expected = entry["history"]
+            else:
+                events.append((entry.pop("t", 0), kind, entry))
+    events.sort(key=lambda e: e[0])
+    return {"path": path, "meta": meta, "events": events, "expected": expected}
+
+
+def _event_object(kind: str, fields: dict) -> SimpleNamespace:
+    if kind == "conversation_item_added":
+        return SimpleNamespace(item=SimpleNamespace(**fields))
+    return SimpleNamespace(**fields)
+
+
+async def replay_once(corpus: dict, index: int, speed: float) -> dict:
+    """Reproduz a conversa uma vez e retorna custos, tráfego e histórico."""
+    room_name = f"replay-{index}"
+    counters = ReplayCounters()
+    metadata = json.dumps(corpus["meta"].get("metadata", {"session_id": room_name}))
+    room = FakeRoom(room_name, metadata, counters)
+    ctx = FakeJobContext(room, {"default_config": dict(agent.DEFAULT_CONFIG)})
+    await agent.entrypoint(ctx)
+    session = benchmark._created_sessions.pop(room_name)
+    tm = agent._registry.get(room_name)["tm"]
+
+    options = corpus["meta"].get("options", {})
+    tm.publisher.batching = bool(options.get("batch", False))
+    tm.append_deltas = bool(options.get("append", False))
+    tm.publisher.set_encoding(options.get("encoding", "json"))
+
+    costs: dict = {}
+    t0 = time.perf_counter()
+    for t_ms, kind, fields in corpus["events"]:
+        if speed > 0:
+            delay = t_ms / 1000 / speed - (time.perf_counter() - t0)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        event = _event_object(kind, fields)
+        t_event = time.perf_counter()
+        session.emit(kind, event)
+        costs.setdefault(kind, []).append(time.perf_counter() - t_event)
+        await asyncio.sleep(0)
+
+    history = [dict(m) for m in tm.history]
+    room.emit("disconnected")
+    await ctx.shutdown()  # drena a fila do DataChannel
+    return {
+        "costs": costs,
+        "messages": tm.publisher.metrics["messages"],
+        "packets": counters.packets,
+        "bytes": counters.bytes,
+        "history": history,
+    }
+
+
+def _bench_prompt(corpus: dict, history: list, iterations: int) -> dict:
+    job = {
+        "history": history,
+        "evaluation_prompt": corpus["meta"].get("evaluation_prompt") or agent.DEFAULT_CONFIG["evaluation_prompt"],
+        "notes": corpus["meta"].get("notes", []),
+    }
+    samples = []
+    prompt = ""
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        prompt = agent.build_evaluation_prompt(job)
+        samples.append(time.perf_counter() - t0)
+    return {"avg_us": round(statistics.fmean(samples) * 1e6, 1), "chars": len(prompt)}
+
+
+def _us_stats(values: list) -> dict:
+    ordered = sorted(values)
+    return {
+        "count": len(ordered),
+        "avg_us": round(statistics.fmean(ordered) * 1e6, 1),
+        "p50_us": round(agent._percentile(ordered, 50) * 1e6, 1),
+        "p95_us": round(agent._percentile(ordered, 95) * 1e6, 1),
+        "max_us": round(ordered[-1] * 1e6, 1),
+    }
+
+
+async def replay_corpus(corpus: dict, args: argparse.Namespace, index: int) -> dict:
+    runs = [await replay_once(corpus, index * 1000 + i, args.speed) for i in range(args.iterations)]
+    costs: dict = {}
+    for run in runs:
+        for kind, values in run["costs"].items():
+            costs.setdefault(kind, []).extend(values)
+    all_costs = [v for values in costs.values() for v in values]
+    last = runs[-1]
+    return {
+        "name": corpus["meta"].get("name", corpus["path"]),
+        "events": len(corpus["events"]),
+        "per_event": _us_stats(all_costs) if all_costs else {},
+        "per_event_type": {kind: _us_stats(values) for kind, values in sorted(costs.items())},
+        "messages": last["messages"],
+        "packets": last["packets"],
+        "bytes": last["bytes"],
+        "history_messages": len(last["history"]),
+        "history_ok": None if corpus["expected"] is None else last["history"] == corpus["expected"],
+        "history": last["history"],
+        "evaluation_prompt": _bench_prompt(corpus, last["history"], args.prompt_iterations),
+    }
+
+
+def _write_expected(path: str, history: list):
+    """Regrava a linha "expect" do arquivo com o histórico atual."""
+    with open(path, encoding="utf-8") as f:
+        lines = [line for line in f if line.strip() and json.loads(line).get("event") != "expect"]
+    lines.append(json.dumps({"event": "expect", "history": history}, ensure_ascii=False) + "\n")
+    with open(path, "w", encoding="utf-8") as f:
+        f.writelines(lines)
+
+
+def _print_result(result: dict, baseline: dict = None):
+    status = {True: "✅ histórico OK", False: "❌ histórico DIFERENTE", None: "ℹ️ sem histórico esperado"}
+    print(f"🎞️ {result['name']}: {result['events']} eventos - {status[result['history_ok']]}")
+    line = f"   └─ Por evento: {result['per_event']}"
+    if baseline and baseline.get("per_event", {}).get("avg_us"):
+        delta = (result["per_event"]["avg_us"] / baseline["per_event"]["avg_us"] - 1) * 100
+        line += f" ({delta:+.1f}% vs baseline)"
+    print(line)
+    for kind, stats in result["per_event_type"].items():
+        print(f"      └─ {kind}: {stats}")
+    traffic = f"   └─ DataChannel: {result['messages']} mensagens, {result['packets']} pacotes, {result['bytes']} bytes"
+    if baseline:
+        traffic += f" (baseline: {baseline.get('messages')} / {baseline.get('packets')} / {baseline.get('bytes')})"
+    print(traffic)
+    print(f"   └─ Prompt da avaliação: {result['evaluation_prompt']}")
+
+
+async def run(args: argparse.Namespace) -> list:
+    benchmark.install_fakes(
+        SimpleNamespace(speed=1.0, evaluation_latency_ms=0, egress_latency_ms=0), sessions={}
+    )
+    paths = args.files or sorted(glob.glob(f"{CORPUS_DIR}/*.jsonl"))
+    results = []
+    for index, path in enumerate(paths):
+        corpus = load_corpus(path)
+        result = await replay_corpus(corpus, args, index)
+        result["path"] = path
+        if args.update:
+            _write_expected(path, result["history"])
+            result["history_ok"] = True
+        results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay do corpus de conversas no TranscriptionManager")
+    parser.add_argument("files", nargs="*", help="arquivos .jsonl (padrão: corpus/*.jsonl)")
+    parser.add_argument("--speed", type=float, default=10.0, help="acelera os tempos gravados (0 = sem espera)")
+    parser.add_argument("--iterations", type=int, default=5, help="repetições por conversa")
+    parser.add_argument("--prompt-iterations", type=int, default=200, help="repetições do prompt da avaliação")
+    parser.add_argument("--update", action="store_true", help="regrava o histórico esperado")
+    parser.add_argument("--json", action="store_true", help="imprime o resultado em JSON")
+    parser.add_argument("--output", help="salva o resultado em JSON (para usar como --baseline)")
+    parser.add_argument("--baseline", help="resultado JSON de outra versão para comparar")
+    args = parser.parse_args()
+    agent.setup_logging()
+
+    results = asyncio.run(run(args))
+    for result in results:
+        result.pop("history")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+    if args.json:
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+    else:
+        baseline = {}
+        if args.baseline:
+            with open(args.baseline, encoding="utf-8") as f:
+                baseline = {r["name"]: r for r in json.load(f)}
+        for result in results:
+            _print_result(result, baseline.get(result["name"]))
+
+    if any(r["history_ok"] is False for r in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()